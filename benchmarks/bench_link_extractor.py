@@ -0,0 +1,107 @@
+"""Micro-benchmark for the on_message Uber Eats link extractor.
+
+Runs the single-pass extractor (first link only, as on_message uses it)
+against the old per-surface substring scan, over message shapes recorded
+from ticket channels including Tickets v2 form submissions. Link-free
+messages are the ones that matter: they are the overwhelming majority.
+
+    python benchmarks/bench_link_extractor.py [--number N] [--repeat R]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import discord
+from main import extract_ubereats_links
+
+GROUP_LINK = (
+    "https://eats.uber.com/group-orders/1f0c7a4e-9d2b-4c51-8f3e-2a6b5d9e0c11/join"
+    "?pl=JTdCJTIyYWRkcmVzcyUyMiUzQSUyMjEyMzUlMjBOVyUyMDEwM3JkJTIwTG4lMjIlN0Q%3D"
+)
+
+# Shapes as they arrive from the gateway: (content, [embed dicts])
+SHAPES = {
+    "chat, no link": ("ok thanks, how long does it usually take?", []),
+    "chat, long, no link": ("lorem ipsum dolor sit amet " * 80, []),
+    "chat, link in content": (f"here is my group order <{GROUP_LINK}> thanks!", []),
+    "tickets v2 form, link in field": ("", [{
+        "title": "Order Form",
+        "description": "Submitted by @customer",
+        "fields": [
+            {"name": "Name", "value": "Jordan", "inline": False},
+            {"name": "Group order link", "value": GROUP_LINK, "inline": False},
+            {"name": "Subtotal before taxes", "value": "$27.40", "inline": False},
+            {"name": "Notes", "value": "extra napkins please " * 10, "inline": False},
+        ],
+    }]),
+    "tickets v2 form, no link": ("", [{
+        "title": "Order Form",
+        "description": "Submitted by @customer",
+        "fields": [{"name": f"Question {i}", "value": "an answer that is not a link " * 4, "inline": False}
+                   for i in range(10)],
+    }]),
+    "embed description link": ("", [{"title": "Ticket", "description": f"Link: [group order]({GROUP_LINK})"}]),
+}
+
+
+def legacy_extract(content, embeds):
+    """The previous on_message scan, kept here as the baseline"""
+    ubereats_link = None
+    if "ubereats.com" in content or "eats.uber.com" in content:
+        for word in content.split():
+            if "ubereats.com" in word or "eats.uber.com" in word:
+                ubereats_link = word.strip(">,<()")
+                break
+    if not ubereats_link:
+        for embed in embeds:
+            if embed.url and ("ubereats.com" in embed.url or "eats.uber.com" in embed.url):
+                ubereats_link = embed.url
+                break
+            if embed.description and ("ubereats.com" in embed.description or "eats.uber.com" in embed.description):
+                for word in embed.description.split():
+                    if "ubereats.com" in word or "eats.uber.com" in word:
+                        ubereats_link = word.strip(">,<()[]")
+                        break
+                if ubereats_link:
+                    break
+            if embed.fields:
+                for field in embed.fields:
+                    if "ubereats.com" in field.name or "eats.uber.com" in field.name:
+                        for word in field.name.split():
+                            if "ubereats.com" in word or "eats.uber.com" in word:
+                                ubereats_link = word.strip(">,<()[]")
+                                break
+                    if not ubereats_link and ("ubereats.com" in field.value or "eats.uber.com" in field.value):
+                        for word in field.value.split():
+                            if "ubereats.com" in word or "eats.uber.com" in word:
+                                ubereats_link = word.strip(">,<()[]")
+                                break
+                    if ubereats_link:
+                        break
+            if ubereats_link:
+                break
+    return ubereats_link
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="calls per shape per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per shape; the fastest counts")
+    args = parser.parse_args()
+
+    print(f"{'shape':<32} {'legacy µs':>10} {'extractor µs':>13} {'speedup':>8}  link")
+    for name, (content, embed_dicts) in SHAPES.items():
+        embeds = [discord.Embed.from_dict(d) for d in embed_dicts]
+        # Best of several runs, so a noisy machine doesn't decide the comparison
+        legacy = min(timeit.repeat(lambda: legacy_extract(content, embeds), number=args.number, repeat=args.repeat))
+        new = min(timeit.repeat(lambda: extract_ubereats_links(content, embeds, limit=1), number=args.number, repeat=args.repeat))
+        links = extract_ubereats_links(content, embeds)
+        found = links[0][:40] + "…" if links else "-"
+        print(f"{name:<32} {legacy / args.number * 1e6:>10.2f} {new / args.number * 1e6:>13.2f} {legacy / new:>7.1f}x  {found}")
+
+
+if __name__ == "__main__":
+    main()
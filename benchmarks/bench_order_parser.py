@@ -0,0 +1,109 @@
+"""Benchmark for the order tracking page parser used by fetch_order_status.
+
+Feeds each sample page's bytes to OrderStatusParser in the same 64 KiB
+chunks the HTTP stream delivers, and compares it with the old whole-page parse
+(decode everything, four IGNORECASE regexes, repeated lower()). Both
+results are printed so any disagreement is visible.
+
+Saved tracking pages can be passed with --pages DIR (every *.html file in
+it is used); otherwise synthetic pages shaped like Uber Eats order pages
+(minified markup plus a large inline JSON state blob) are generated.
+
+    python benchmarks/bench_order_parser.py [--pages DIR] [--number N]
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from main import ORDER_PAGE_CHUNK, OrderStatusParser
+
+
+def legacy_parse(html):
+    """The previous fetch_order_status body, kept here as the baseline"""
+    driver_name = None
+    driver_car = None
+    driver_plate = None
+    estimated_time = None
+    name_match = re.search(r'driver["\']?\s*[:=]\s*["\']?([^"\'<>]+)["\']?', html, re.IGNORECASE)
+    if name_match:
+        driver_name = name_match.group(1).strip()
+    car_match = re.search(r'(car|vehicle|car_type)["\']?\s*[:=]\s*["\']?([^"\'<>]+)["\']?', html, re.IGNORECASE)
+    if car_match:
+        driver_car = car_match.group(2).strip()
+    plate_match = re.search(r'(plate|license|license_plate|registration)["\']?\s*[:=]\s*["\']?([A-Z0-9]+)["\']?', html, re.IGNORECASE)
+    if plate_match:
+        driver_plate = plate_match.group(2).strip()
+    time_match = re.search(r'(delivery.*?time|estimated|arrives|arrival|deliver.*?by)["\']?\s*[:=]\s*["\']?(\d+\s*(?:min|minutes|mins|hr|hours?))["\']?', html, re.IGNORECASE)
+    if time_match:
+        estimated_time = time_match.group(2).strip()
+    if "PREPARING" in html or "preparing" in html.lower():
+        return {"status": "Preparing", "driver_name": None, "driver_car": None, "driver_plate": None, "estimated_time": estimated_time}
+    elif "CONFIRMED" in html or "confirmed" in html.lower():
+        return {"status": "Confirmed", "driver_name": None, "driver_car": None, "driver_plate": None, "estimated_time": estimated_time}
+    elif "DELIVERING" in html or "delivering" in html.lower():
+        return {"status": "On the Way", "driver_name": driver_name, "driver_car": driver_car, "driver_plate": driver_plate, "estimated_time": estimated_time}
+    elif "DELIVERED" in html or "delivered" in html.lower():
+        return {"status": "Delivered", "driver_name": driver_name, "driver_car": driver_car, "driver_plate": driver_plate, "estimated_time": estimated_time}
+    return {"status": "Preparing", "driver_name": None, "driver_car": None, "driver_plate": None, "estimated_time": estimated_time}
+
+
+def legacy(page):
+    return legacy_parse(page.decode("utf-8", errors="replace"))
+
+
+def streamed(page):
+    parser = OrderStatusParser()
+    for start in range(0, len(page), ORDER_PAGE_CHUNK):
+        if parser.feed(page[start:start + ORDER_PAGE_CHUNK]):
+            break
+    result = parser.finish()
+    del result["progress"], result["emoji"]
+    return result
+
+
+def synthetic_page(state, size_kb, seed):
+    rng = random.Random(seed)
+    words = ["menu", "item", "price", "store", "cart", "promo", "image", "section", "title", "uuid"]
+    catalog = [{rng.choice(words): rng.choice(words) + str(rng.randrange(10 ** 6)) for _ in range(8)} for _ in range(size_kb * 6)]
+    order = {"orderPhase": state, "etaSummary": {"estimated": "25 min"}}
+    if state in ("DELIVERING", "DELIVERED"):
+        order["courier"] = {"driver": "Marcus T", "vehicle": "Silver Honda Civic", "plate": "7XKP492"}
+    markup = "".join(f'<div class="c{i}"><span>{rng.choice(words)}</span></div>' for i in range(size_kb * 4))
+    state_json = json.dumps({"catalog": catalog, "activeOrder": order})
+    return f'<!DOCTYPE html><html><head><title>Order</title></head><body>{markup}<script id="__NEXT_DATA__">{state_json}</script></body></html>'.encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", help="directory of saved tracking pages (*.html)")
+    parser.add_argument("--number", type=int, default=20, help="parses per page")
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = {}
+        for path in sorted(glob.glob(os.path.join(args.pages, "*.html"))):
+            with open(path, "rb") as f:
+                pages[os.path.basename(path)] = f.read()
+    else:
+        pages = {f"{state.lower()}, {kb} KiB": synthetic_page(state, kb, kb)
+                 for state in ("PREPARING", "DELIVERING", "DELIVERED") for kb in (200, 1000)}
+
+    print(f"{'page':<24} {'bytes':>9} {'legacy ms':>10} {'stream ms':>10} {'speedup':>8}  result")
+    for name, page in pages.items():
+        old = timeit.timeit(lambda: legacy(page), number=args.number) / args.number
+        new = timeit.timeit(lambda: streamed(page), number=args.number) / args.number
+        result = streamed(page)
+        marker = "" if result == legacy(page) else "  (differs from legacy)"
+        summary = ", ".join(f"{k}={v}" for k, v in result.items() if v)
+        print(f"{name:<24} {len(page):>9} {old * 1e3:>10.2f} {new * 1e3:>10.2f} {old / new:>7.1f}x  {summary}{marker}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Load test for the Stripe webhook, run entirely offline.
+
+Serves the app from build_webhook_app() on a local port, with a temporary
+database and a stub channel standing in for bot.get_channel. Each event
+pays a payment link quote recorded up front for its own ticket. It then fires
+locally signed checkout.session.completed events at /webhook at the given
+concurrency. A fraction of them are replayed, as Stripe does on retry.
+Reports acknowledgement latency percentiles, throughput, status counts and
+how many confirmations the workers sent. It exits non-zero when a gate is
+exceeded, so it can run before a deploy.
+
+By default the burst is as many unique events as the queue holds, so every
+one should be accepted: any 503 (queue full) or other error fails the run.
+To study overload, send a bigger burst and allow some 503s with
+--max-busy-rate; other errors still fail unless --max-error-rate allows them.
+
+    python benchmarks/bench_webhook.py [--events N] [--concurrency C]
+        [--replay FRACTION] [--send-ms MS] [--workers W] [--queue-limit Q]
+        [--max-p99-ms MS] [--max-error-rate FRACTION] [--max-busy-rate FRACTION]
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WEBHOOK_SECRET = "whsec_bench"
+CHANNEL_ID = 1430000000000000000
+AMOUNTS = (1500, 2500, 3250)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(_tmp.name, "bench.db")
+os.environ["STRIPE_WEBHOOK_SECRET"] = WEBHOOK_SECRET
+
+import aiohttp
+from aiohttp import web
+
+import main
+
+
+class StubChannel:
+    """Accepts confirmations like a text channel, after a fixed delay"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.sent = 0
+
+    async def send(self, embed=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.sent += 1
+
+
+def checkout_event(n: int) -> str:
+    return json.dumps({
+        "id": f"evt_bench_{n}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {
+            "id": f"cs_bench_{n}",
+            "object": "checkout.session",
+            "client_reference_id": str(CHANNEL_ID + n),
+            "amount_total": AMOUNTS[n % len(AMOUNTS)],
+            "metadata": {},
+        }},
+    })
+
+
+def sign(payload: str, secret: str = WEBHOOK_SECRET) -> str:
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+async def ready():
+    # The bot never logs in here, so there is no READY to wait for
+    pass
+
+
+async def run(args):
+    # Per-request warnings (queue full, duplicates) would drown the report
+    main.log.setLevel(logging.ERROR)
+    channel = StubChannel(args.send_ms / 1000)
+    main.bot.get_channel = lambda channel_id: channel
+    main.webhook_processor = main.WebhookProcessor(args.workers, args.queue_limit, ready=ready)
+    await main.db.start()
+    for n in range(args.events):
+        await main.db.write(main._insert_payment_quote, CHANNEL_ID + n, AMOUNTS[n % len(AMOUNTS)])
+    await main.webhook_processor.start()
+
+    runner = web.AppRunner(main.build_webhook_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f"http://{host}:{port}/webhook"
+
+    payloads = [checkout_event(n) for n in range(args.events)]
+    payloads += random.sample(payloads, int(len(payloads) * args.replay))
+    random.shuffle(payloads)
+
+    latencies = []
+    statuses = {}
+    pending = iter(payloads)
+
+    async def client(session):
+        for payload in pending:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, data=payload, headers={"stripe-signature": sign(payload)}) as resp:
+                    await resp.read()
+                    status = resp.status
+            except aiohttp.ClientError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    await main.webhook_processor.drain()
+    drained = time.perf_counter() - started
+
+    await runner.cleanup()
+    await main.db.close()
+
+    latencies.sort()
+    total = len(latencies)
+    busy = statuses.get(503, 0)
+    errors = total - statuses.get(200, 0) - busy
+    p50, p95, p99 = (percentile(latencies, f) * 1000 for f in (0.50, 0.95, 0.99))
+    print(f"requests      {total} ({args.events} unique, {total - args.events} replays), concurrency {args.concurrency}")
+    print(f"ack latency   p50 {p50:.2f} ms   p95 {p95:.2f} ms   p99 {p99:.2f} ms   max {latencies[-1] * 1000:.2f} ms")
+    print(f"throughput    {total / elapsed:.0f} req/s over {elapsed:.2f} s")
+    print("statuses      " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+    print(f"busy (503)    {busy / total:.2%}")
+    print(f"error rate    {errors / total:.2%} (other than 503)")
+    print(f"confirmations {channel.sent} sent, all done {drained:.2f} s after the first request")
+
+    failed = []
+    if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+        failed.append(f"p99 {p99:.2f} ms > {args.max_p99_ms} ms")
+    if errors / total > args.max_error_rate:
+        failed.append(f"error rate {errors / total:.2%} > {args.max_error_rate:.2%}")
+    if busy / total > args.max_busy_rate:
+        failed.append(f"busy rate {busy / total:.2%} > {args.max_busy_rate:.2%}")
+    if channel.sent > args.events:
+        failed.append(f"{channel.sent - args.events} duplicate confirmations")
+    for reason in failed:
+        print(f"FAIL: {reason}")
+    return 1 if failed else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=None, help="unique events to send (default: the queue limit)")
+    parser.add_argument("--concurrency", type=int, default=50, help="requests in flight")
+    parser.add_argument("--replay", type=float, default=0.1, help="fraction of events sent a second time")
+    parser.add_argument("--send-ms", type=float, default=150, help="stub channel.send latency")
+    parser.add_argument("--workers", type=int, default=main.WEBHOOK_WORKERS)
+    parser.add_argument("--queue-limit", type=int, default=main.WEBHOOK_QUEUE_LIMIT)
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="fail if p99 ack latency exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="fail if the fraction of non-200, non-503 responses exceeds this")
+    parser.add_argument("--max-busy-rate", type=float, default=0.0, help="fail if the fraction of 503 (queue full) responses exceeds this")
+    args = parser.parse_args()
+    if args.events is None:
+        args.events = args.queue_limit
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
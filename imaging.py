@@ -0,0 +1,269 @@
+# Image processing for vouches. Kept free of discord/bot state so it can run
+# inside ProcessPoolExecutor workers without dragging the bot along.
+import functools
+import logging
+import sys
+from io import BytesIO
+from typing import NamedTuple
+from PIL import Image, ImageOps
+
+WATERMARK_SCALE = 0.30  # watermark width relative to the image
+WATERMARK_OPACITY = 0.55
+
+# Alpha scaling as a lookup table instead of a per-pixel Python lambda
+_ALPHA_LUT = [int(p * WATERMARK_OPACITY) for p in range(256)]
+
+log = logging.getLogger("dishdynasty.imaging")
+
+_watermark = None
+
+# format name -> (PIL format, file extension)
+_FORMATS = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg"), "png": ("PNG", "png")}
+_MIN_QUALITY = 40
+
+
+class EncodingPolicy(NamedTuple):
+    """How watermarked vouches are written out.
+
+    `max_dim` caps the longest side (0 = keep full resolution) and
+    `max_bytes` caps the encoded size (0 = no cap); lossy formats step
+    quality down before the image is shrunk further.
+    """
+    format: str = "webp"
+    quality: int = 85
+    max_dim: int = 2048
+    max_bytes: int = 0
+    animated_format: str = "webp"
+    max_gif_frames: int = 300
+
+    @classmethod
+    def parse(cls, fmt: str, quality: int, max_dim: int, max_bytes: int,
+              animated_format: str = "webp", max_gif_frames: int = 300) -> "EncodingPolicy":
+        fmt = fmt.lower().replace("jpg", "jpeg")
+        if fmt not in _FORMATS:
+            raise ValueError(f"unsupported vouch image format: {fmt!r}")
+        animated_format = animated_format.lower()
+        if animated_format not in ("webp", "gif"):
+            raise ValueError(f"unsupported animated vouch format: {animated_format!r}")
+        return cls(fmt, max(1, min(quality, 100)), max(0, max_dim), max(0, max_bytes),
+                   animated_format, max(1, max_gif_frames))
+
+    @property
+    def extension(self) -> str:
+        return _FORMATS[self.format][1]
+
+
+_policy = EncodingPolicy()
+
+
+def _build_overlay(target_w: int) -> Image.Image:
+    wm_ratio = _watermark.width / _watermark.height
+    target_h = int(target_w / wm_ratio)
+    overlay = _watermark.resize((target_w, target_h), Image.LANCZOS)
+    alpha = ImageOps.autocontrast(overlay.getchannel("A"))
+    overlay.putalpha(alpha.point(_ALPHA_LUT))
+    return overlay
+
+
+_overlay_for_width = functools.lru_cache(maxsize=16)(_build_overlay)
+
+
+def init_worker(watermark_bytes: bytes, cache_size: int = 16, policy: EncodingPolicy = None, log_level: str = "INFO"):
+    """Decode the watermark once per worker and reset the overlay cache"""
+    global _watermark, _overlay_for_width, _policy
+    # Workers are separate processes, so they log straight to stdout
+    logging.basicConfig(stream=sys.stdout, format="%(asctime)s %(levelname)-7s %(name)s %(message)s")
+    log.setLevel(log_level)
+    _policy = policy or EncodingPolicy()
+    _watermark = None
+    if watermark_bytes:
+        with Image.open(BytesIO(watermark_bytes)) as wm:
+            _watermark = wm.convert("RGBA")
+    _overlay_for_width = functools.lru_cache(maxsize=cache_size)(_build_overlay)
+
+
+def _decode(data: bytes, max_dim: int) -> Image.Image:
+    with Image.open(BytesIO(data)) as src:
+        if max_dim and src.format == "JPEG":
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size
+            src.draft("RGB", (max_dim, max_dim))
+        img = src.convert("RGBA")
+    if max_dim and max(img.size) > max_dim:
+        img.thumbnail((max_dim, max_dim), Image.LANCZOS)
+    return img
+
+
+def _encode(img: Image.Image, policy: EncodingPolicy) -> bytes:
+    pil_format = _FORMATS[policy.format][0]
+    if pil_format == "JPEG":
+        img = img.convert("RGB")
+    quality = policy.quality
+    while True:
+        output = BytesIO()
+        if pil_format == "PNG":
+            img.save(output, format="PNG")
+        else:
+            img.save(output, format=pil_format, quality=quality)
+        data = output.getvalue()
+        if not policy.max_bytes or len(data) <= policy.max_bytes or min(img.size) <= 64:
+            return data
+        if pil_format != "PNG" and quality > _MIN_QUALITY:
+            quality = max(_MIN_QUALITY, quality - 10)
+        else:
+            img = img.resize((int(img.width * 0.75), int(img.height * 0.75)), Image.LANCZOS)
+            log.debug("Output %d bytes over cap, downscaling to %dx%d", len(data), img.width, img.height)
+
+
+def watermark_image(original_bytes: bytes) -> tuple:
+    """Watermark a still or animated image; returns `(data, extension)`"""
+    if _watermark is None:
+        raise RuntimeError("watermark not loaded in this worker")
+    log.debug("Applying watermark to %d byte image", len(original_bytes))
+    with Image.open(BytesIO(original_bytes)) as src:
+        if getattr(src, "n_frames", 1) > 1:
+            return _watermark_animation(src, _policy)
+
+    base = _decode(original_bytes, _policy.max_dim)
+
+    base_w, base_h = base.size
+    overlay = _overlay_for_width(int(base_w * WATERMARK_SCALE))
+    pos = ((base_w - overlay.width) // 2, (base_h - overlay.height) // 2)
+    log.debug("Watermark positioned at %s, size %dx%d", pos, overlay.width, overlay.height)
+
+    base.paste(overlay, pos, mask=overlay)
+
+    data = _encode(base, _policy)
+    log.info("Watermark applied, output %d bytes (%s)", len(data), _policy.format)
+    return data, _policy.extension
+
+
+# ---------------- Animated images ----------------
+def _fit(size: tuple, max_dim: int, scale: float = 1.0) -> tuple:
+    w, h = size
+    ratio = scale
+    if max_dim and max(w, h) * ratio > max_dim:
+        ratio = max_dim / max(w, h)
+    return max(1, round(w * ratio)), max(1, round(h * ratio))
+
+
+def _composite_frame(frame: Image.Image, size: tuple) -> Image.Image:
+    img = frame.convert("RGBA")
+    if img.size != size:
+        img = img.resize(size, Image.LANCZOS)
+    overlay = _overlay_for_width(int(size[0] * WATERMARK_SCALE))
+    img.paste(overlay, ((size[0] - overlay.width) // 2, (size[1] - overlay.height) // 2), mask=overlay)
+    return img
+
+
+def _source_frames(src: Image.Image, count: int, size: tuple):
+    for index in range(count):
+        src.seek(index)
+        yield _composite_frame(src, size), src.info.get("duration") or 100
+
+
+class _FrameStream(Image.Image):
+    """Animation whose frames are produced on demand for Pillow's writers.
+
+    The WebP and GIF encoders walk their input with seek(), so handing them
+    this instead of a list of frames keeps one decoded frame alive at a time.
+    Frames can only be read forward; durations are recorded as they go.
+    """
+
+    def __init__(self, frames, n_frames: int, size: tuple):
+        super().__init__()
+        self._frames = frames
+        self.n_frames = n_frames
+        self.is_animated = n_frames > 1
+        self.durations = []
+        self._index = -1
+        self._mode = "RGBA"
+        self._size = size
+        self.seek(0)
+
+    def seek(self, frame: int):
+        if frame <= self._index:
+            # Writers rewind to the start frame when they finish; nothing to do
+            return
+        if frame != self._index + 1 or frame >= self.n_frames:
+            raise EOFError("no more frames")
+        img, duration = next(self._frames)
+        self.im = img.im
+        self._size = img.size
+        self.durations.append(duration)
+        self._index = frame
+
+    def tell(self) -> int:
+        return self._index
+
+
+def _encode_animation(frames, n_frames: int, size: tuple, loop, policy: EncodingPolicy) -> bytes:
+    stream = _FrameStream(frames, n_frames, size)
+    output = BytesIO()
+    if policy.animated_format == "gif":
+        # A missing loop count means "play once" in GIF
+        extra = {} if loop is None else {"loop": loop}
+        stream.save(output, format="GIF", save_all=True, duration=stream.durations, **extra)
+    else:
+        stream.save(output, format="WEBP", save_all=True, duration=stream.durations,
+                    loop=1 if loop is None else loop, quality=policy.quality)
+    return output.getvalue()
+
+
+def _animation_policy(n_frames: int, policy: EncodingPolicy) -> EncodingPolicy:
+    # Pillow's GIF writer buffers every frame, so long animations go out as
+    # WebP (which streams) rather than losing frames
+    if policy.animated_format == "gif" and n_frames > policy.max_gif_frames:
+        log.info("%d frames is over the GIF limit of %d, encoding as webp", n_frames, policy.max_gif_frames)
+        return policy._replace(animated_format="webp")
+    return policy
+
+
+def _watermark_animation(src: Image.Image, policy: EncodingPolicy) -> tuple:
+    count = src.n_frames
+    policy = _animation_policy(count, policy)
+    loop = src.info.get("loop")
+    scale = 1.0
+    for _ in range(3):
+        size = _fit(src.size, policy.max_dim, scale)
+        data = _encode_animation(_source_frames(src, count, size), count, size, loop, policy)
+        if not policy.max_bytes or len(data) <= policy.max_bytes:
+            break
+        scale *= 0.75
+        log.debug("Animated output %d bytes over cap, retrying at %.2fx", len(data), scale)
+    log.info("Watermarked %d frames at %dx%d, output %d bytes (%s)", count, size[0], size[1], len(data), policy.animated_format)
+    return data, policy.animated_format
+
+
+# Frame-parallel mode: workers composite frame ranges, the caller streams
+# them into the encoder (the WebP encoder releases the GIL while it works).
+def probe_animation(original_bytes: bytes):
+    """Return `(frame count, output size, loop)` for animations, else None"""
+    with Image.open(BytesIO(original_bytes)) as src:
+        if getattr(src, "n_frames", 1) <= 1:
+            return None
+        return src.n_frames, _fit(src.size, _policy.max_dim), src.info.get("loop")
+
+
+def composite_frames(original_bytes: bytes, start: int, stop: int, size: tuple) -> list:
+    """Watermark frames [start, stop) and return them as raw RGBA with durations"""
+    frames = []
+    with Image.open(BytesIO(original_bytes)) as src:
+        for index in range(start, stop):
+            src.seek(index)
+            frame = _composite_frame(src, size)
+            frames.append((frame.tobytes(), src.info.get("duration") or 100))
+    return frames
+
+
+def encode_frame_chunks(chunks, n_frames: int, size: tuple, loop, policy: EncodingPolicy) -> tuple:
+    """Encode an animation from an iterator of `composite_frames` results"""
+    policy = _animation_policy(n_frames, policy)
+
+    def frames():
+        for chunk in chunks:
+            for raw, duration in chunk:
+                yield Image.frombytes("RGBA", size, raw), duration
+
+    data = _encode_animation(frames(), n_frames, size, loop, policy)
+    log.info("Watermarked %d frames across workers, output %d bytes (%s)", n_frames, len(data), policy.animated_format)
+    return data, policy.animated_format
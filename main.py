@@ -11,27 +11,33 @@ if sys.stdout.encoding != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.ui import View, Button
 import sqlite3
 import aiohttp
+from aiohttp import web
 import stripe
 import asyncio
+import bisect
+import contextlib
+import heapq
+import copy
+import itertools
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from io import BytesIO
-from PIL import Image, ImageOps
+import imaging
 import urllib.parse
 import json
+import logging
+import logging.handlers
+import queue
+import random
 import re
+from collections import OrderedDict, deque
 
-try:
-    from playwright.async_api import async_playwright
-except ImportError:
-    async_playwright = None
-
-# Disable urllib3 warnings
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+BOOT_STARTED = time.monotonic()  # time-to-ready is measured from here
 
 # Get config FIRST
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
@@ -41,43 +47,15 @@ STRIPE_API_KEY = os.environ.get("STRIPE_API_KEY", "")
 BOT_TOKEN = ''.join(c for c in BOT_TOKEN if not c.isspace() and ord(c) >= 32)
 STRIPE_API_KEY = ''.join(c for c in STRIPE_API_KEY if not c.isspace() and ord(c) >= 32)
 
-print(f"✅ FINAL BOT_TOKEN length: {len(BOT_TOKEN)}")
-print(f"✅ FINAL STRIPE_API_KEY length: {len(STRIPE_API_KEY)}")
-
-# Configure Stripe with UTF-8 headers
-stripe.api_key = STRIPE_API_KEY
-stripe.api_base = "https://api.stripe.com"
-
-if not STRIPE_API_KEY:
-    print("⚠️  WARNING: STRIPE_API_KEY not found in environment variables!")
-if not BOT_TOKEN:
-    print("⚠️  WARNING: BOT_TOKEN not found in environment variables!")
-
-# Patch requests to force UTF-8
-import requests
-original_request = requests.adapters.HTTPAdapter.send
-
-def patched_send(self, request, **kwargs):
-    # Ensure all headers are ASCII-safe
-    if hasattr(request, 'headers'):
-        for key in list(request.headers.keys()):
-            try:
-                request.headers[key].encode('ascii')
-            except (UnicodeEncodeError, AttributeError):
-                del request.headers[key]
-    return original_request(self, request, **kwargs)
-
-requests.adapters.HTTPAdapter.send = patched_send
-
-import requests.utils
-original_to_native = requests.utils.to_native_string
-
-def safe_to_native(string, encoding='utf-8'):
-    if isinstance(string, bytes):
-        return string.decode(encoding, errors='ignore')
-    return str(string)
-
-requests.utils.to_native_string = safe_to_native
+# Stripe calls go through the async client on its own pooled aiohttp session.
+# Retried POSTs carry an idempotency key, so a retry never creates a second session.
+STRIPE_TIMEOUT = float(os.environ.get("STRIPE_TIMEOUT", "20"))
+STRIPE_CONNECT_TIMEOUT = float(os.environ.get("STRIPE_CONNECT_TIMEOUT", "5"))
+STRIPE_MAX_RETRIES = int(os.environ.get("STRIPE_MAX_RETRIES", "2"))
+stripe_http = stripe.AIOHTTPClient(
+    timeout=aiohttp.ClientTimeout(total=STRIPE_TIMEOUT, connect=STRIPE_CONNECT_TIMEOUT)
+)
+stripe_client = stripe.StripeClient(STRIPE_API_KEY, http_client=stripe_http, max_network_retries=STRIPE_MAX_RETRIES)
 
 GUILD_ID = 1429807376298414252
 SOURCE_CHANNEL_ID = 1430523739480658032
@@ -85,171 +63,1380 @@ REVIEW_CHANNEL_ID = 1432005106534055948
 
 WATERMARK_URL = "https://cdn.discordapp.com/attachments/1430523739480658032/1438937291052552433/F9C40A73-07D0-448A-9744-F63E4EC53213.png?ex=6918b248&is=691760c8&hm=d7067d9c03105e2ba0bbf551e4a5d9a5c9de9e65907a3223320c0c3e9780dacb&"
 
-ALLOWED_ROLE_NAMES = ["Head Chef", "Chef🍳"]
-
-DB_PATH = "vouch_points.db"
-ORDER_TRACKING = {}
-PAYMENT_SESSIONS = {}
+ALLOWED_ROLE_NAMES = ("Head Chef", "Chef🍳")
+HEAD_CHEF_ROLE_NAMES = ("Head Chef",)
+
+DB_PATH = os.environ.get("DB_PATH", "vouch_points.db")
+CACHE_DIR = os.environ.get("CACHE_DIR", "cache")  # downloaded assets kept across restarts
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "FULL")  # FULL | NORMAL
+DB_BATCH_MAX = int(os.environ.get("DB_BATCH_MAX", "256"))  # writes per group commit
+LEADERBOARD_TOP_K = int(os.environ.get("LEADERBOARD_TOP_K", "100"))
+LEADERBOARD_PAGE_SIZE = 10
+
+# Watermarking runs in worker processes; approvals beyond the queue limit are turned away
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+IMAGE_QUEUE_LIMIT = int(os.environ.get("IMAGE_QUEUE_LIMIT", "8"))
+WATERMARK_CACHE_SIZE = int(os.environ.get("WATERMARK_CACHE_SIZE", "16"))  # overlays kept per worker, keyed by width
+
+# Output encoding for approved vouches: webp | jpeg | png
+VOUCH_ENCODING = imaging.EncodingPolicy.parse(
+    os.environ.get("VOUCH_IMAGE_FORMAT", "webp"),
+    quality=int(os.environ.get("VOUCH_IMAGE_QUALITY", "85")),
+    max_dim=int(os.environ.get("VOUCH_IMAGE_MAX_DIM", "2048")),
+    max_bytes=int(os.environ.get("VOUCH_IMAGE_MAX_BYTES", str(8 * 1024 * 1024))),
+    animated_format=os.environ.get("VOUCH_ANIMATED_FORMAT", "webp"),  # webp | gif
+    max_gif_frames=int(os.environ.get("VOUCH_MAX_GIF_FRAMES", "300"))  # longer animations are sent as webp
+)
+# Animations longer than this many frames are split across image workers (0 = never)
+ANIMATION_CHUNK_FRAMES = int(os.environ.get("ANIMATION_CHUNK_FRAMES", "0"))
+
+# Shared outbound HTTP pool (seconds / connection counts)
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "15"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", "10"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", "300"))
+
+# Uber Eats link inspection cache
+LINK_CACHE_TTL = float(os.environ.get("LINK_CACHE_TTL", "300"))
+LINK_CACHE_SIZE = int(os.environ.get("LINK_CACHE_SIZE", "512"))
+ORDER_TRACKING = {}  # message id -> TrackedOrder, mirrored in the orders table
+# Order tracking polls: seconds between fetches per status, spread by +/- jitter
+TRACKING_INTERVALS = {"Preparing": 60, "Confirmed": 45, "On the Way": 15}
+TRACKING_DEFAULT_INTERVAL = 30
+TRACKING_JITTER = float(os.environ.get("TRACKING_JITTER", "0.2"))
+TRACKING_CONCURRENCY = int(os.environ.get("TRACKING_CONCURRENCY", "8"))
+DELIVERED_MESSAGE_TTL = 420  # delivered tracking messages are deleted after this many seconds
+# Tracking message edits per channel (Discord's message edit route is bucketed by channel)
+EDIT_RATE = int(os.environ.get("EDIT_RATE", "5"))
+EDIT_PER = float(os.environ.get("EDIT_PER", "5"))
+ORDER_PAGE_CHUNK = 64 * 1024
+ORDER_PAGE_MAX_BYTES = int(os.environ.get("ORDER_PAGE_MAX_BYTES", str(2 * 1024 * 1024)))  # stop reading tracking pages past this
+# Dollar amounts whose payment links are created at startup, e.g. "25,30,35.50"
+PAYMENT_LINK_WARM_AMOUNTS = [a for a in os.environ.get("PAYMENT_LINK_WARM_AMOUNTS", "").split(",") if a.strip()]
+PAYMENT_SESSION_TTL = float(os.environ.get("PAYMENT_SESSION_TTL", str(24 * 3600)))  # Checkout sessions expire after 24h
+PAYMENT_CLAIM_TTL = 7 * 24 * 3600  # confirmed sessions are remembered this long (Stripe retries for 3 days)
 WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", "whsec_test")
-PROCESSED_MESSAGES = set()  # Track processed message IDs to prevent duplicates
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_LIMIT = int(os.environ.get("WEBHOOK_QUEUE_LIMIT", "256"))  # beyond this Stripe gets a 503 and retries
+WEBHOOK_EVENT_TTL = 7 * 24 * 3600  # processed event IDs are remembered this long (Stripe retries for 3 days)
+# A failed event is retried in-process, backing off from the first delay up to the cap (seconds)
+WEBHOOK_RETRY_DELAY = float(os.environ.get("WEBHOOK_RETRY_DELAY", "5"))
+WEBHOOK_RETRY_MAX_DELAY = float(os.environ.get("WEBHOOK_RETRY_MAX_DELAY", "300"))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "8"))  # then the event is logged and dropped
+# Duplicate gateway deliveries are dropped within this window (seconds, by snowflake time)
+DEDUPE_WINDOW = float(os.environ.get("DEDUPE_WINDOW", "600"))
+DEDUPE_MAX = int(os.environ.get("DEDUPE_MAX", "10000"))  # hard ceiling on remembered IDs
 # ----------------------------------------
 
+# ---------------- Metrics ----------------
+# Hand-rolled Prometheus text exposition, served at /metrics on the webhook
+# server. Series live in memory and reset on restart, which Prometheus
+# handles for counters and histograms.
+METRICS = []
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in pairs) + "}"
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        METRICS.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    async def render(self) -> list:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *await self.samples()]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {} if labelnames else {(): 0}  # an unlabelled counter reports 0 from the start
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    async def samples(self) -> list:
+        return [f"{self.name}{_label_text(list(zip(self.labelnames, key)))} {value}" for key, value in self._values.items()]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the block's duration; an `outcome` label gets ok or error"""
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            if "outcome" in self.labelnames:
+                labels["outcome"] = outcome
+            self.observe(time.perf_counter() - started, **labels)
+
+    async def samples(self) -> list:
+        lines = []
+        for key, (counts, total, count) in self._series.items():
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_label_text(pairs + [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(pairs)} {total}")
+            lines.append(f"{self.name}_count{_label_text(pairs)} {count}")
+        return lines
+
+class Gauge(Metric):
+    """Read at scrape time from `fn`, which may be a coroutine function"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn):
+        super().__init__(name, help_text)
+        self.fn = fn
+
+    async def samples(self) -> list:
+        value = self.fn()
+        if asyncio.iscoroutine(value):
+            value = await value
+        return [f"{self.name} {value}"]
+
+async def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        try:
+            lines += await metric.render()
+        except Exception as e:
+            log.warning("Metric collection failed", extra={"metric": metric.name, "error": str(e)})
+    return "\n".join(lines) + "\n"
+
+def traced(histogram: Histogram, classify) -> aiohttp.TraceConfig:
+    """TraceConfig observing every request's duration with `classify(method, url)` labels and its status"""
+    async def on_start(session, trace_ctx, params):
+        trace_ctx.started = time.perf_counter()
+
+    async def on_end(session, trace_ctx, params):
+        histogram.observe(time.perf_counter() - trace_ctx.started, status=params.response.status, **classify(params.method, params.url))
+
+    async def on_exception(session, trace_ctx, params):
+        histogram.observe(time.perf_counter() - trace_ctx.started, status="error", **classify(params.method, params.url))
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    trace.on_request_exception.append(on_exception)
+    return trace
+
+DISCORD_MESSAGE_PATH = re.compile(r"/channels/\d+/messages(/\d+)?$")
+
+def discord_operation(method: str, url) -> dict:
+    """Name Discord REST calls by what they do to messages"""
+    match = DISCORD_MESSAGE_PATH.search(url.path)
+    if match and method == "POST" and not match.group(1):
+        return {"op": "send"}
+    if match and method == "PATCH" and match.group(1):
+        return {"op": "edit"}
+    if match and method == "DELETE" and match.group(1):
+        return {"op": "delete"}
+    if "/interactions/" in url.path or "/webhooks/" in url.path:
+        return {"op": "interaction"}
+    return {"op": "other"}
+
+discord_request_seconds = Histogram("discord_request_seconds", "Discord REST call latency by operation and status", ("op", "status"))
+http_fetch_seconds = Histogram("http_fetch_seconds", "Outbound HTTP fetch latency by host and status", ("host", "status"))
+db_call_seconds = Histogram("db_call_seconds", "SQLite call latency including queueing, by kind and function", ("kind", "op"))
+stripe_request_seconds = Histogram("stripe_request_seconds", "Stripe create call latency by object and outcome", ("op", "outcome"))
+watermark_seconds = Histogram("watermark_image_seconds", "Vouch image watermarking latency including pool wait", ("outcome",))
+Gauge("orders_tracked", "Orders currently being tracked", lambda: len(ORDER_TRACKING))
+webhook_events_total = Counter("webhook_events_total", "Stripe webhook deliveries by outcome", ("outcome",))
+webhook_retries_total = Counter("webhook_retries_total", "Webhook handler failures scheduled for retry")
+webhook_events_abandoned_total = Counter("webhook_events_abandoned_total", "Webhook events dropped after WEBHOOK_MAX_ATTEMPTS failures")
+image_jobs_rejected_total = Counter("image_jobs_rejected_total", "Image jobs refused because the queue was full")
+tracking_edits_avoided_total = Counter("tracking_edits_avoided_total", "Tracking message edits not sent to Discord, by reason", ("reason",))
+dedupe_evicted_early_total = Counter("dedupe_evicted_early_total", "Message IDs evicted by the dedupe ceiling while still inside the window")
+
 intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
 intents.messages = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = commands.Bot(command_prefix="!", intents=intents, http_trace=traced(discord_request_seconds, discord_operation))
 
-# ---------------- Role Check ----------------
-def has_chef_role(member: discord.Member):
-    return any(role.name in ALLOWED_ROLE_NAMES for role in member.roles)
+# ---------------- Logging ----------------
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Per-category sampling of DEBUG/INFO records, e.g. "messages=0.01,tickets=0.5"
+LOG_SAMPLE = os.environ.get("LOG_SAMPLE", "")
 
-# ---------------- SQLite helpers ----------------
-def init_db():
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS points (
-                user_id INTEGER PRIMARY KEY,
-                points INTEGER NOT NULL
-            );
-        """)
-        conn.commit()
-        conn.close()
-    except sqlite3.DatabaseError:
-        print(f"⚠️ Database corrupted, recreating...")
-        import os
+log = logging.getLogger("dishdynasty")
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of DEBUG/INFO records per category; warnings always pass"""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name.rpartition(".")[2], 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: time, level, logger, message, then key=value fields from `extra`"""
+
+    _STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name} {record.getMessage()}"
+        fields = " ".join(f"{key}={value!r}" for key, value in record.__dict__.items() if key not in self._STANDARD)
+        if fields:
+            line = f"{line} | {fields}"
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve args and tracebacks now (they may not survive the hop to the
+        # listener thread) but leave the line itself to StructuredFormatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def parse_sample_rates(spec: str) -> dict:
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        category, _, rate = part.partition("=")
         try:
-            os.remove(DB_PATH)
-        except:
+            rates[category.strip()] = float(rate)
+        except ValueError:
             pass
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS points (
-                user_id INTEGER PRIMARY KEY,
-                points INTEGER NOT NULL
-            );
-        """)
-        conn.commit()
-        conn.close()
-        print(f"✅ Database recreated successfully")
-
-def get_points(user_id: int) -> int:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT points FROM points WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    conn.close()
+    return rates
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route every logger (ours and discord.py's) through a queue drained off the event loop"""
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(StructuredFormatter())
+    listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+
+    handler = LogQueueHandler(records)
+    handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE)))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(logging.INFO)
+    log.setLevel(LOG_LEVEL)
+    listener.start()
+    return listener
+
+startup_log = log.getChild("startup")
+db_log = log.getChild("db")
+http_log = log.getChild("http")
+tickets_log = log.getChild("tickets")
+messages_log = log.getChild("messages")
+vouch_log = log.getChild("vouch")
+payments_log = log.getChild("payments")
+tracking_log = log.getChild("tracking")
+commands_log = log.getChild("commands")
+services_log = log.getChild("services")
+
+# ---------------- Role Check ----------------
+class RoleResolver:
+    """Role names resolved to role IDs once per guild.
+
+    Checks then compare IDs instead of scanning a member's roles by name.
+    Role events re-resolve the guild by name, exactly as a restart would, so
+    access never depends on uptime; a staff role renamed away is logged.
+    """
+
+    def __init__(self):
+        self._ids = {}  # (guild id, role names) -> frozenset of role ids
+
+    @staticmethod
+    def _resolve(guild: discord.Guild, names) -> frozenset:
+        return frozenset(role.id for role in guild.roles if role.name in names)
+
+    def role_ids(self, guild: discord.Guild, names) -> frozenset:
+        key = (guild.id, names)
+        ids = self._ids.get(key)
+        if ids is None:
+            ids = self._ids[key] = self._resolve(guild, names)
+        return ids
+
+    def refresh(self, guild: discord.Guild):
+        for key, ids in list(self._ids.items()):
+            if key[0] == guild.id:
+                self._ids[key] = self._resolve(guild, key[1])
+                lost = ids - self._ids[key]
+                if lost:
+                    commands_log.warning("Roles no longer match staff role names",
+                                         extra={"guild_id": guild.id, "role_ids": sorted(lost), "names": key[1]})
+
+role_resolver = RoleResolver()
+
+def has_roles(member, names=ALLOWED_ROLE_NAMES) -> bool:
+    if not isinstance(member, discord.Member):
+        return False  # DMs and users who left the guild
+    return any(member.get_role(role_id) for role_id in role_resolver.role_ids(member.guild, names))
+
+class MissingStaffRole(commands.CheckFailure):
+    def __init__(self, quiet: bool):
+        super().__init__("missing staff role")
+        self.quiet = quiet
+
+def staff_only(names=ALLOWED_ROLE_NAMES, quiet: bool = False):
+    """Command check; `quiet` commands also have the invoking message removed when refused"""
+    def predicate(ctx):
+        if has_roles(ctx.author, names):
+            return True
+        raise MissingStaffRole(quiet)
+    return commands.check(predicate)
+
+async def staff_interaction_check(interaction: discord.Interaction, action: str, names=ALLOWED_ROLE_NAMES) -> bool:
+    """View/item interaction_check: True for staff, otherwise tell the user why not"""
+    if has_roles(interaction.user, names):
+        return True
+    await interaction.response.send_message(f"❌ You don't have permission to {action}.", ephemeral=True)
+    return False
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    role_resolver.refresh(role.guild)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    if before.name != after.name:
+        role_resolver.refresh(after.guild)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    role_resolver.refresh(role.guild)
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, MissingStaffRole):
+        if error.quiet:
+            try:
+                await ctx.message.delete()
+            except discord.HTTPException:
+                pass
+            await ctx.send("❌ You don't have permission to use this command.", delete_after=5)
+        else:
+            await ctx.reply("❌ You don't have permission to use this command.")
+        return
+    if isinstance(error, commands.CommandNotFound):
+        return
+    commands_log.error("Command failed", exc_info=error, extra={"command": ctx.command.qualified_name if ctx.command else None})
+
+# ---------------- SQLite persistence ----------------
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS points (
+        user_id INTEGER PRIMARY KEY,
+        points INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_points_rank ON points(points DESC, user_id);
+    CREATE TABLE IF NOT EXISTS reviews (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        author_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        image BLOB NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS orders (
+        message_id INTEGER PRIMARY KEY,
+        channel_id INTEGER NOT NULL,
+        link TEXT NOT NULL,
+        status TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL,
+        delivered_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_orders_delivered ON orders(delivered_at) WHERE delivered_at IS NOT NULL;
+    CREATE TABLE IF NOT EXISTS payment_sessions (
+        session_id TEXT PRIMARY KEY,
+        channel_id INTEGER NOT NULL,
+        amount TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        claimed_at REAL,
+        claimed_by TEXT
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_payment_sessions_created ON payment_sessions(created_at);
+    CREATE TABLE IF NOT EXISTS webhook_events (
+        event_id TEXT PRIMARY KEY,
+        payload TEXT NOT NULL,
+        received_at REAL NOT NULL,
+        processed_at REAL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_webhook_events_pending ON webhook_events(received_at) WHERE processed_at IS NULL;
+    CREATE TABLE IF NOT EXISTS payment_quotes (
+        channel_id INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        claimed_by TEXT,
+        PRIMARY KEY (channel_id, amount_cents)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS payment_links (
+        amount_cents INTEGER PRIMARY KEY,
+        price_id TEXT NOT NULL,
+        link_id TEXT NOT NULL,
+        url TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+"""
+# Columns added to tables after they first shipped: (table, column, declaration)
+SCHEMA_COLUMNS = (
+    ("payment_sessions", "claimed_at", "REAL"),
+    ("payment_sessions", "claimed_by", "TEXT"),
+    ("payment_quotes", "claimed_by", "TEXT"),
+)
+
+def _add_missing_columns(conn: sqlite3.Connection):
+    for table, column, declaration in SCHEMA_COLUMNS:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+class Database:
+    """Long-lived SQLite connection driven from one dedicated executor thread.
+
+    Nothing here touches the disk on the event loop. Reads are dispatched to
+    the executor directly; writes are queued and group-committed, so every
+    write that arrives while a commit is in progress shares the next
+    transaction (and its fsync).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn = None
+        self._writes = None
+        self._writer_task = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-8000")
+        conn.executescript(SCHEMA)
+        _add_missing_columns(conn)
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        try:
+            return self._connect()
+        except sqlite3.DatabaseError:
+            db_log.warning("Database corrupted, recreating", extra={"path": self.path})
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self.path + suffix)
+                except OSError:
+                    pass
+            conn = self._connect()
+            db_log.info("Database recreated", extra={"path": self.path})
+            return conn
+
+    async def start(self):
+        if self._conn is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._conn = await loop.run_in_executor(self._executor, self._open)
+        self._writes = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer())
+        db_log.info("Database opened", extra={"path": self.path})
+
+    async def read(self, fn, *args):
+        """Run `fn(conn, *args)` on the database thread"""
+        loop = asyncio.get_running_loop()
+        with db_call_seconds.time(kind="read", op=fn.__name__):
+            return await loop.run_in_executor(self._executor, fn, self._conn, *args)
+
+    async def write(self, fn, *args):
+        """Queue `fn(conn, *args)` for the next group commit and wait for it"""
+        future = asyncio.get_running_loop().create_future()
+        self._writes.put_nowait((fn, args, future))
+        with db_call_seconds.time(kind="write", op=fn.__name__):
+            return await future
+
+    def _commit_batch(self, batch: list) -> list:
+        conn = self._conn
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for fn, args, _ in batch:
+                # A savepoint per write keeps one bad statement from failing the batch
+                conn.execute("SAVEPOINT batch_item")
+                try:
+                    results.append((True, fn(conn, *args)))
+                    conn.execute("RELEASE batch_item")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO batch_item")
+                    conn.execute("RELEASE batch_item")
+                    results.append((False, e))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._writes.get()]
+            while len(batch) < DB_BATCH_MAX and not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+
+            stop = any(item is None for item in batch)
+            batch = [item for item in batch if item is not None]
+            if batch:
+                try:
+                    results = await loop.run_in_executor(self._executor, self._commit_batch, batch)
+                except Exception as e:
+                    db_log.error("Batch commit failed", extra={"batch": len(batch), "error": str(e)})
+                    results = [(False, e)] * len(batch)
+                for (_, _, future), (ok, value) in zip(batch, results):
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+            if stop:
+                return
+
+    async def close(self):
+        if self._conn is None:
+            return
+        # The sentinel lets queued writes commit before the writer exits
+        self._writes.put_nowait(None)
+        await self._writer_task
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._conn.close)
+        self._conn = None
+        self._executor.shutdown(wait=False)
+        db_log.info("Database closed")
+
+db = Database(DB_PATH)
+
+def _select_points(conn: sqlite3.Connection, user_id: int) -> int:
+    row = conn.execute("SELECT points FROM points WHERE user_id = ?", (user_id,)).fetchone()
     return row[0] if row else 0
 
-def add_point(user_id: int, amount: int = 1) -> int:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
+def _upsert_points(conn: sqlite3.Connection, user_id: int, amount: int) -> int:
+    conn.execute(
         "INSERT INTO points(user_id, points) VALUES(?, ?) ON CONFLICT(user_id) DO UPDATE SET points = points + ?",
         (user_id, amount, amount)
     )
-    conn.commit()
-    c.execute("SELECT points FROM points WHERE user_id = ?", (user_id,))
-    new = c.fetchone()[0]
-    conn.close()
+    return _select_points(conn, user_id)
+
+async def get_points(user_id: int) -> int:
+    return await db.read(_select_points, user_id)
+
+async def add_point(user_id: int, amount: int = 1) -> int:
+    new = await db.write(_upsert_points, user_id, amount)
+    leaderboard.update(user_id, new)
     return new
 
+# ---------------- Leaderboard ----------------
+def _select_standings(conn: sqlite3.Connection, cursor, limit: int) -> list:
+    # Keyset pagination over idx_points_rank: (points DESC, user_id ASC)
+    if cursor is None:
+        rows = conn.execute(
+            "SELECT user_id, points FROM points ORDER BY points DESC, user_id ASC LIMIT ?",
+            (limit,)
+        )
+    else:
+        last_points, last_user_id = cursor
+        rows = conn.execute(
+            "SELECT user_id, points FROM points WHERE points < ? OR (points = ? AND user_id > ?) "
+            "ORDER BY points DESC, user_id ASC LIMIT ?",
+            (last_points, last_points, last_user_id, limit)
+        )
+    return rows.fetchall()
+
+def _select_rank(conn: sqlite3.Connection, user_id: int) -> tuple:
+    pts = _select_points(conn, user_id)
+    ahead = conn.execute("SELECT COUNT(*) FROM points WHERE points > ?", (pts,)).fetchone()[0]
+    return pts, ahead + 1
+
+class Leaderboard:
+    """Top-K standings held in memory and updated incrementally by add_point.
+
+    Entries are kept sorted as (-points, user_id) so the best score sits at
+    index 0 and ties break on user ID, matching idx_points_rank. Pages and
+    ranks inside the top K never touch the disk; anything past it falls
+    back to an indexed keyset query.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries = []
+        self._scores = {}
+        self._complete = False  # True while the top K holds every row in the table
+        self._loaded = False
+
+    async def load(self):
+        rows = await db.read(_select_standings, None, self.size + 1)
+        self._complete = len(rows) <= self.size
+        self._entries = sorted((-pts, user_id) for user_id, pts in rows[:self.size])
+        self._scores = {user_id: -neg for neg, user_id in self._entries}
+        self._loaded = True
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    def update(self, user_id: int, points: int):
+        if not self._loaded:
+            return
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            del self._entries[bisect.bisect_left(self._entries, (-old, user_id))]
+            if points < old and not self._complete:
+                # Someone outside the top K may now outrank them; rebuild on next read
+                self._loaded = False
+                return
+        elif len(self._entries) >= self.size and (-points, user_id) > self._entries[-1]:
+            # A new row below the cut: the top K no longer holds the whole table
+            self._complete = False
+            return
+
+        bisect.insort(self._entries, (-points, user_id))
+        self._scores[user_id] = points
+        if len(self._entries) > self.size:
+            _, dropped = self._entries.pop()
+            del self._scores[dropped]
+            self._complete = False
+
+    async def page(self, cursor=None, limit: int = 10) -> tuple:
+        """Return `(rows, next_cursor)` where rows are `(user_id, points)`"""
+        await self._ensure_loaded()
+        start = 0
+        if cursor is not None:
+            start = bisect.bisect_right(self._entries, (-cursor[0], cursor[1]))
+
+        if self._complete or start + limit < len(self._entries):
+            chunk = self._entries[start:start + limit + 1]
+            rows = [(user_id, -neg) for neg, user_id in chunk]
+        else:
+            rows = await db.read(_select_standings, cursor, limit + 1)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1][1], rows[-1][0])
+        return rows, next_cursor
+
+    async def rank(self, user_id: int) -> tuple:
+        """Return `(points, rank)`; users with equal points share a rank"""
+        await self._ensure_loaded()
+        pts = self._scores.get(user_id)
+        if pts is not None:
+            return pts, bisect.bisect_left(self._entries, (-pts,)) + 1
+        return await db.read(_select_rank, user_id)
+
+leaderboard = Leaderboard(LEADERBOARD_TOP_K)
+
+# ---------------- HTTP client ----------------
+class HttpClient:
+    """Bot-scoped aiohttp session shared by every outbound fetch.
+
+    One connector means DNS lookups, TCP connections and TLS sessions are
+    reused across ticket links, attachments and tracking polls instead of
+    being rebuilt per request.
+    """
+
+    def __init__(self):
+        self._session = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            use_dns_cache=True,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        trace = traced(http_fetch_seconds, lambda method, url: {"host": url.host})
+        return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace])
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+            http_log.info("HTTP client started", extra={"limit": HTTP_POOL_LIMIT, "limit_per_host": HTTP_POOL_LIMIT_PER_HOST})
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Fall back to a lazy start so a fetch racing startup still works
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    def get(self, url: str, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            http_log.info("HTTP client closed")
+        self._session = None
+
+http_client = HttpClient()
+
 # ---------------- Utility ----------------
-async def fetch_bytes(session: aiohttp.ClientSession, url: str) -> bytes:
-    async with session.get(url) as resp:
+async def fetch_bytes(url: str) -> bytes:
+    async with http_client.get(url) as resp:
         resp.raise_for_status()
         return await resp.read()
 
-async def parse_ubereats_group_link(link: str) -> dict:
-    """Check if Uber Eats group order link is valid"""
-    try:
-        print(f"Checking Uber Eats link: {link}")
-        async with aiohttp.ClientSession() as session:
-            async with session.get(link, timeout=aiohttp.ClientTimeout(total=15), ssl=False) as resp:
-                if resp.status == 200:
-                    return {"success": True}
-                else:
-                    return {"success": False}
-    except Exception as e:
-        print(f"Error checking Uber Eats link: {e}")
-        return {"success": False}
-
-async def check_restaurant_eligibility(link: str, address: str = None) -> dict:
-    """Check if restaurant is eligible for $25 off $25 promo at given address"""
+# ---------------- Link extraction ----------------
+# A full Uber Eats link, with or without scheme/subdomains. Lookarounds pin
+# the host at both ends, so look-alikes such as evilubereats.com or
+# eats.uber.community never match; only surfaces that mention "uber" are
+# searched at all.
+UBEREATS_LINK_RE = re.compile(
+    r"(?<![\w.-])(?:https?://)?(?:[\w-]+\.)*(?:ubereats\.com|eats\.uber\.com)(?![\w-]|\.\w)(?:[/?#][^\s<>\"'\]]*)?"
+)
+
+def message_text_surfaces(content: str, embeds):
+    """Every text surface of a message, in the order links should be preferred"""
+    yield content
+    for embed in embeds:
+        yield embed.url or ""
+        yield embed.description or ""
+        for field in embed.fields:
+            yield field.name
+            yield field.value
+
+def _normalize_link(link: str) -> str:
+    link = link.rstrip(".,;:!?")
+    # A markdown [text](url) closes with a paren that isn't part of the URL
+    while link.endswith(")") and link.count(")") > link.count("("):
+        link = link[:-1]
+    if not link.startswith(("http://", "https://")):
+        link = "https://" + link
+    return link
+
+def extract_ubereats_links(content: str, embeds=(), limit: int = 0) -> list:
+    """Return normalized Uber Eats URLs found in message content and embeds.
+
+    Surfaces are walked in preference order, stopping after `limit` links
+    (0 = all). A plain substring check skips every surface without "uber"
+    before the precompiled pattern runs over it.
+    """
+    if not embeds:
+        if "uber" not in content:
+            return []
+        surfaces = (content,)
+    else:
+        surfaces = message_text_surfaces(content, embeds)
+
+    links = []
+    for text in surfaces:
+        if "uber" not in text:
+            continue
+        for match in UBEREATS_LINK_RE.finditer(text):
+            link = _normalize_link(match.group(0))
+            if link not in links:
+                links.append(link)
+                if len(links) == limit:
+                    return links
+    return links
+
+# ---------------- Link inspection ----------------
+class TTLCache:
+    """Bounded mapping with per-entry expiry and least-recently-used eviction."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+def normalize_link(link: str) -> str:
+    """Canonical cache key for a link: lowercase scheme/host, no fragment"""
+    parts = urllib.parse.urlsplit(link.strip())
+    path = parts.path.rstrip("/") or "/"
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+def extract_link_address(link: str):
+    """Pull the delivery address out of the encoded `pl=` payload, if present"""
+    if "pl=" not in link:
+        return None
+    encoded_data = link.split("pl=")[1].split("&")[0]
     try:
-        # Extract address from the link if it contains encoded data
-        if "pl=" in link:
-            encoded_data = link.split("pl=")[1].split("&")[0]
-            try:
-                decoded = urllib.parse.unquote(encoded_data)
-                # Parse the JSON-like encoded data
-                address_match = re.search(r'"address":"([^"]+)"', decoded)
-                if address_match:
-                    address = address_match.group(1)
-            except:
-                pass
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(link, timeout=aiohttp.ClientTimeout(total=10), ssl=False) as resp:
-                if resp.status == 200:
-                    html = await resp.text()
-                    # If page loads and contains restaurant info, it's eligible
-                    if "restaurant" in html.lower() or "ubereats" in html.lower():
-                        return {
-                            "eligible": True,
-                            "address": address or "Address detected",
-                            "status": "✅ Eligible Restaurant"
-                        }
-        
-        return {
-            "eligible": False,
-            "address": address or "Unknown",
-            "status": "❌ Ineligible Restaurant"
-        }
-    except Exception as e:
-        print(f"Error checking eligibility: {e}")
-        return {
+        decoded = urllib.parse.unquote(encoded_data)
+        # Parse the JSON-like encoded data
+        address_match = re.search(r'"address":"([^"]+)"', decoded)
+        if address_match:
+            return address_match.group(1)
+    except Exception:
+        pass
+    return None
+
+class LinkInspector:
+    """Checks an Uber Eats group order link with a single page fetch.
+
+    The page is downloaded once and used for both the validity check and the
+    $25 off $25 eligibility check. Results are cached by normalized URL and
+    concurrent lookups of the same link share one in-flight request.
+    """
+
+    def __init__(self, cache: TTLCache):
+        self._cache = cache
+        self._inflight = {}
+
+    async def inspect(self, link: str) -> dict:
+        key = normalize_link(link)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, link))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one cancelled waiter doesn't abort the fetch for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, link: str) -> dict:
+        address = extract_link_address(link)
+        result = {
+            "success": False,
             "eligible": False,
             "address": address or "Unknown",
             "status": "❌ Ineligible Restaurant"
         }
+        try:
+            tickets_log.debug("Checking Uber Eats link", extra={"link": link})
+            async with http_client.get(link, timeout=aiohttp.ClientTimeout(total=15), ssl=False) as resp:
+                if resp.status == 200:
+                    result["success"] = True
+                    html = (await resp.text()).lower()
+                    # If page loads and contains restaurant info, it's eligible
+                    if "restaurant" in html or "ubereats" in html:
+                        result["eligible"] = True
+                        result["address"] = address or "Address detected"
+                        result["status"] = "✅ Eligible Restaurant"
+        except Exception as e:
+            # Network failures aren't cached so the next post retries
+            tickets_log.warning("Uber Eats link check failed", extra={"link": link, "error": str(e)})
+            return result
+        self._cache.set(key, result)
+        return result
+
+link_inspector = LinkInspector(TTLCache(maxsize=LINK_CACHE_SIZE, ttl=LINK_CACHE_TTL))
+
+# ---------------- Image worker pool ----------------
+class ImagePoolBusy(Exception):
+    """Raised when too many approvals are already waiting for an image worker"""
+
+class ImageWorkerPool:
+    """Bounded process pool for CPU-heavy PIL work.
+
+    At most `workers` jobs are handed to the executor at once; up to
+    `queue_limit` more may wait for a slot. Past that, `run` raises
+    ImagePoolBusy so callers can push back instead of piling up work.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = None
+        self.watermark_bytes = None
+        self._slots = asyncio.Semaphore(workers)
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn keeps workers clear of the bot's threads and sockets; each
+        # worker decodes the watermark once in its initializer. Started via
+        # run.py, a worker imports only imaging.
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=imaging.init_worker,
+            initargs=(self.watermark_bytes, WATERMARK_CACHE_SIZE, VOUCH_ENCODING, LOG_LEVEL)
+        )
+
+    def start(self):
+        if self._executor is None:
+            self._executor = self._create_executor()
+            vouch_log.info("Image worker pool started", extra={"workers": self.workers, "queue_limit": self.queue_limit})
+
+    async def set_watermark(self, watermark_bytes: bytes):
+        """Hand workers a new watermark, recycling them only if it changed"""
+        if watermark_bytes == self.watermark_bytes:
+            return
+        self.watermark_bytes = watermark_bytes
+        if self._executor is None:
+            self.start()
+            return
+        # Swap in the new pool first so no job ever sees a missing executor;
+        # jobs already on the old pool finish there before it is retired
+        old, self._executor = self._executor, self._create_executor()
+        await asyncio.to_thread(old.shutdown, wait=True)
+        vouch_log.info("Image workers recycled with new watermark")
+
+    @property
+    def busy(self) -> bool:
+        return self.running >= self.workers
+
+    async def run(self, fn, *args):
+        if self.waiting >= self.queue_limit:
+            self.rejected += 1
+            image_jobs_rejected_total.inc()
+            raise ImagePoolBusy(f"{self.waiting} image jobs already waiting")
+        self.start()
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            executor = self._executor
+            if executor is None:
+                # Shut down while this job waited; never fall back to the default thread pool
+                raise ImagePoolBusy("image worker pool is shut down")
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, fn, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._slots.release()
+
+    async def run_frame_chunks(self, original_bytes: bytes, n_frames: int, size: tuple, loop, chunk: int) -> tuple:
+        """Watermark an animation with frame ranges spread over the workers.
+
+        Encoding happens on a helper thread that pulls finished chunks in
+        order; at most `workers` chunks are outstanding so memory stays bounded.
+        """
+        event_loop = asyncio.get_running_loop()
+        ranges = iter([(start, min(start + chunk, n_frames)) for start in range(0, n_frames, chunk)])
+
+        def submit(bounds):
+            job = self.run(imaging.composite_frames, original_bytes, *bounds, size)
+            return asyncio.run_coroutine_threadsafe(job, event_loop)
+
+        def chunks():
+            pending = deque(submit(bounds) for bounds in itertools.islice(ranges, self.workers))
+            try:
+                while pending:
+                    frames = pending.popleft().result()
+                    bounds = next(ranges, None)
+                    if bounds is not None:
+                        pending.append(submit(bounds))
+                    yield frames
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        return await asyncio.to_thread(imaging.encode_frame_chunks, chunks(), n_frames, size, loop, VOUCH_ENCODING)
+
+    def stats(self) -> str:
+        return f"{self.running}/{self.workers} running, {self.waiting} waiting, {self.completed} done, {self.rejected} rejected"
+
+    async def shutdown(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+            vouch_log.info("Image worker pool stopped")
+
+image_pool = ImageWorkerPool(IMAGE_WORKERS, IMAGE_QUEUE_LIMIT)
+Gauge("image_jobs_waiting", "Image jobs queued for a worker", lambda: image_pool.waiting)
+
+async def watermark_image(original_bytes: bytes) -> tuple:
+    """Watermark a vouch image in the worker pool; returns `(buffer, filename)`"""
+    with watermark_seconds.time():
+        if ANIMATION_CHUNK_FRAMES:
+            probe = await image_pool.run(imaging.probe_animation, original_bytes)
+            if probe and probe[0] > ANIMATION_CHUNK_FRAMES:
+                data, ext = await image_pool.run_frame_chunks(original_bytes, *probe, ANIMATION_CHUNK_FRAMES)
+                return BytesIO(data), f"vouch.{ext}"
+        data, ext = await image_pool.run(imaging.watermark_image, original_bytes)
+        return BytesIO(data), f"vouch.{ext}"
+
+# ---------------- Payment Sessions ----------------
+# Outstanding Checkout sessions, keyed by session id. A confirmed session
+# keeps its row, marked with the event that claimed it, so a redelivered
+# event is recognised while a retry of the claiming event still goes through. The
+# channel and amount also ride along in the session metadata, so a completed
+# payment can still be confirmed if its row has expired or was written by
+# another process.
+def _insert_payment_session(conn: sqlite3.Connection, session_id: str, channel_id: int, amount: str):
+    conn.execute(
+        "INSERT OR REPLACE INTO payment_sessions(session_id, channel_id, amount, created_at) VALUES(?, ?, ?, ?)",
+        (session_id, channel_id, amount, time.time())
+    )
+
+def _claim_payment_session(conn: sqlite3.Connection, session_id: str, event_id: str):
+    """(channel_id, amount, claimed) for a session, or None if there is no row.
+
+    `claimed` is False when a different event already confirmed the session.
+    """
+    row = conn.execute(
+        "SELECT channel_id, amount, claimed_at, claimed_by FROM payment_sessions WHERE session_id = ?", (session_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    channel_id, amount, claimed_at, claimed_by = row
+    if claimed_at is not None:
+        return channel_id, amount, claimed_by == event_id
+    conn.execute(
+        "UPDATE payment_sessions SET claimed_at = ?, claimed_by = ? WHERE session_id = ?",
+        (time.time(), event_id, session_id)
+    )
+    return channel_id, amount, True
+
+def _expire_payment_sessions(conn: sqlite3.Connection, created_before: float, claimed_before: float) -> int:
+    unclaimed = conn.execute(
+        "DELETE FROM payment_sessions WHERE claimed_at IS NULL AND created_at < ?", (created_before,)
+    ).rowcount
+    claimed = conn.execute("DELETE FROM payment_sessions WHERE claimed_at < ?", (claimed_before,)).rowcount
+    return unclaimed + claimed
+
+def _count_payment_sessions(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM payment_sessions WHERE claimed_at IS NULL").fetchone()[0]
+
+Gauge("payment_sessions_outstanding", "Checkout sessions awaiting payment", lambda: db.read(_count_payment_sessions))
+
+# Amounts quoted to a ticket through a shared payment link. The link's
+# client_reference_id is editable by whoever holds the URL, so a payment
+# only confirms in a ticket that was actually quoted that amount.
+def _insert_payment_quote(conn: sqlite3.Connection, channel_id: int, amount_cents: int):
+    conn.execute(
+        "INSERT OR REPLACE INTO payment_quotes(channel_id, amount_cents, created_at) VALUES(?, ?, ?)",
+        (channel_id, amount_cents, time.time())
+    )
+
+def _claim_payment_quote(conn: sqlite3.Connection, channel_id: int, amount_cents: int, created_after: float, event_id: str) -> bool:
+    return conn.execute(
+        "UPDATE payment_quotes SET claimed_by = ? WHERE channel_id = ? AND amount_cents = ? AND created_at >= ?"
+        " AND (claimed_by IS NULL OR claimed_by = ?)",
+        (event_id, channel_id, amount_cents, created_after, event_id)
+    ).rowcount == 1
+
+def _expire_payment_quotes(conn: sqlite3.Connection, created_before: float) -> int:
+    return conn.execute("DELETE FROM payment_quotes WHERE created_at < ?", (created_before,)).rowcount
+
+def _count_payment_quotes(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM payment_quotes WHERE claimed_by IS NULL").fetchone()[0]
+
+Gauge("payment_quotes_outstanding", "Payment link quotes awaiting payment", lambda: db.read(_count_payment_quotes))
+
+async def sweep_payment_sessions():
+    now = time.time()
+    expired = await db.write(_expire_payment_sessions, now - PAYMENT_SESSION_TTL, now - PAYMENT_CLAIM_TTL)
+    if expired:
+        payments_log.info("Expired payment sessions removed", extra={"sessions": expired})
+    expired = await db.write(_expire_payment_quotes, now - PAYMENT_SESSION_TTL)
+    if expired:
+        payments_log.info("Expired payment quotes removed", extra={"quotes": expired})
+
+async def resolve_payment_session(session, event_id: str):
+    """(channel_id, amount) for a completed Checkout session, from its row, metadata or reference.
+
+    None if the session was already confirmed or cannot be traced to a ticket.
+    Metadata and the reference are only consulted when there is no row at all.
+    """
+    claim = await db.write(_claim_payment_session, session["id"], event_id)
+    if claim is not None:
+        channel_id, amount, claimed = claim
+        if not claimed:
+            payments_log.info("Payment session already confirmed", extra={"session_id": session["id"]})
+            return None
+        return channel_id, amount
+    metadata = session.get("metadata") or {}
+    if metadata.get("channel_id") and metadata.get("amount"):
+        return int(metadata["channel_id"]), metadata["amount"]
+    # Sessions opened from a cached payment link carry the ticket channel as
+    # client_reference_id; it is only trusted against a quote for that amount
+    reference = session.get("client_reference_id")
+    amount_total = session.get("amount_total")
+    if reference and reference.isdigit() and amount_total is not None:
+        quoted = await db.write(_claim_payment_quote, int(reference), amount_total, time.time() - PAYMENT_SESSION_TTL, event_id)
+        if quoted:
+            return int(reference), format_amount(amount_total)
+        payments_log.warning("Payment reference matches no outstanding quote",
+                             extra={"session_id": session["id"], "reference": reference, "amount_cents": amount_total})
+    return None
+
+# ---------------- Payment Links ----------------
+# One reusable Stripe Price + Payment Link per amount, shared by every ticket
+# that is quoted that amount. The ticket is identified per click by appending
+# client_reference_id to the link URL, which Checkout copies onto the session;
+# each quote is also recorded in payment_quotes so the reference can be checked.
+def format_amount(amount_cents: int) -> str:
+    return f"{amount_cents // 100}" if amount_cents % 100 == 0 else f"{amount_cents / 100:.2f}"
+
+def _select_payment_links(conn: sqlite3.Connection):
+    return conn.execute("SELECT amount_cents, url FROM payment_links").fetchall()
+
+def _insert_payment_link(conn: sqlite3.Connection, amount_cents: int, price_id: str, link_id: str, url: str):
+    conn.execute(
+        "INSERT OR REPLACE INTO payment_links(amount_cents, price_id, link_id, url, created_at) VALUES(?, ?, ?, ?, ?)",
+        (amount_cents, price_id, link_id, url, time.time())
+    )
+
+class PaymentLinkCache:
+    """Payment link URLs by amount in cents, backed by the payment_links table.
+
+    Known amounts are answered from memory without touching Stripe. A miss
+    creates the Price and Payment Link once; concurrent misses for the same
+    amount share that creation.
+    """
+
+    def __init__(self):
+        self._urls = {}
+        self._inflight = {}
+
+    async def load(self):
+        self._urls.update(await db.read(_select_payment_links))
+
+    async def link(self, amount_cents: int) -> str:
+        url = self._urls.get(amount_cents)
+        if url is not None:
+            return url
+        task = self._inflight.get(amount_cents)
+        if task is None:
+            task = asyncio.ensure_future(self._create(amount_cents))
+            self._inflight[amount_cents] = task
+            task.add_done_callback(lambda _: self._inflight.pop(amount_cents, None))
+        return await asyncio.shield(task)
+
+    async def url_for(self, amount_cents: int, channel_id: int) -> str:
+        """Payment link for `amount_cents` that reports back to `channel_id`, with the quote recorded"""
+        url = await self.link(amount_cents)
+        await db.write(_insert_payment_quote, channel_id, amount_cents)
+        return f"{url}?{urllib.parse.urlencode({'client_reference_id': channel_id})}"
+
+    async def _create(self, amount_cents: int) -> str:
+        with stripe_request_seconds.time(op="price"):
+            price = await stripe_client.v1.prices.create_async(params={
+                "currency": "usd",
+                "unit_amount": amount_cents,
+                "product_data": {"name": "Dish Dynasty Order"},
+            })
+        with stripe_request_seconds.time(op="payment_link"):
+            link = await stripe_client.v1.payment_links.create_async(params={
+                "line_items": [{"price": price.id, "quantity": 1}],
+                "metadata": {"amount": format_amount(amount_cents)},
+            })
+        await db.write(_insert_payment_link, amount_cents, price.id, link.id, link.url)
+        self._urls[amount_cents] = link.url
+        payments_log.info("Payment link cached", extra={"amount_cents": amount_cents, "link_id": link.id})
+        return link.url
+
+    async def warm(self, amounts):
+        """Create links for the given dollar amounts that aren't cached yet"""
+        for amount in amounts:
+            amount_cents = round(float(amount) * 100)
+            try:
+                await self.link(amount_cents)
+            except Exception as e:
+                payments_log.warning("Payment link warm-up failed", extra={"amount": amount, "error": str(e)})
+
+payment_links = PaymentLinkCache()
+
+# ---------------- Webhook Events ----------------
+# Stripe events are acknowledged as soon as they are verified and recorded;
+# the Discord side runs later on a small worker pool. The event ID is the
+# primary key, so a redelivered event is recognised and dropped, and events
+# still unprocessed at shutdown are picked up again on the next start.
+def _record_webhook_event(conn: sqlite3.Connection, event_id: str, payload: str) -> bool:
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO webhook_events(event_id, payload, received_at) VALUES(?, ?, ?)",
+        (event_id, payload, time.time())
+    )
+    return cur.rowcount == 1
+
+def _forget_webhook_event(conn: sqlite3.Connection, event_id: str):
+    conn.execute("DELETE FROM webhook_events WHERE event_id = ?", (event_id,))
+
+def _finish_webhook_event(conn: sqlite3.Connection, event_id: str):
+    conn.execute("UPDATE webhook_events SET processed_at = ? WHERE event_id = ?", (time.time(), event_id))
+
+def _select_pending_webhook_events(conn: sqlite3.Connection):
+    return conn.execute(
+        "SELECT event_id, payload FROM webhook_events WHERE processed_at IS NULL ORDER BY received_at"
+    ).fetchall()
+
+def _expire_webhook_events(conn: sqlite3.Connection, processed_before: float):
+    conn.execute("DELETE FROM webhook_events WHERE processed_at < ?", (processed_before,))
+
+async def send_payment_confirmation(event_id: str, session):
+    session_id = session['id']
+    payment_info = await resolve_payment_session(session, event_id)
+    if payment_info is None:
+        return
+    channel_id, amount = payment_info
+    # Not cached yet (or evicted): ask the API, so a failure raises and is retried
+    channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+    embed = discord.Embed(
+        title="✅ Payment Received",
+        description=f"Payment of **${amount}** has been successfully received!",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Amount paid", value=f"${amount}", inline=False)
+    embed.add_field(name="Status", value="✅ Confirmed", inline=False)
+    embed.set_footer(text="Thank you for your payment!")
+    embed.set_thumbnail(url=WATERMARK_URL)
+
+    await channel.send(embed=embed)
+    payments_log.info("Payment confirmation sent", extra={"amount": amount, "channel_id": channel_id, "session_id": session_id, "event_id": event_id})
+
+class WebhookProcessor:
+    """Bounded queue of recorded Stripe events drained by a fixed set of workers"""
+
+    HANDLERS = {"checkout.session.completed": send_payment_confirmation}
+
+    def __init__(self, workers: int, limit: int, ready=None):
+        self.workers = workers
+        self._ready = ready or bot.wait_until_ready  # handlers need the channel cache
+        self._queue = asyncio.Queue(maxsize=limit)
+        self._tasks = []
+        self._attempts = {}  # event id -> failed attempts so far
+        self._retries = set()
+
+    @property
+    def full(self) -> bool:
+        return self._queue.full()
+
+    async def drain(self):
+        """Wait until every queued event has been handled"""
+        await self._queue.join()
 
-async def watermark_image(original_bytes: bytes, watermark_bytes: bytes) -> BytesIO:
-    print(f"Applying watermark... Original image size: {len(original_bytes)} bytes, Watermark size: {len(watermark_bytes)} bytes")
-    with Image.open(BytesIO(original_bytes)).convert("RGBA") as base:
-        if getattr(base, "is_animated", False):
-            base = base.convert("RGBA")
-
-        with Image.open(BytesIO(watermark_bytes)).convert("RGBA") as wm:
-            base_w, base_h = base.size
-            target_w = int(base_w * 0.30)
-            wm_ratio = wm.width / wm.height
-            target_h = int(target_w / wm_ratio)
-            wm_resized = wm.resize((target_w, target_h), Image.LANCZOS)
-            print(f"Watermark positioned at center: ({(base_w - target_w) // 2}, {(base_h - target_h) // 2}), size: {target_w}x{target_h}")
-
-            pos = ((base_w - target_w) // 2, (base_h - target_h) // 2)
-
-            alpha = wm_resized.split()[3]
-            alpha = ImageOps.autocontrast(alpha)
-            alpha = alpha.point(lambda p: int(p * 0.55))
-            wm_resized.putalpha(alpha)
-
-            composite = Image.new("RGBA", base.size)
-            composite.paste(base, (0, 0))
-            composite.paste(wm_resized, pos, mask=wm_resized)
-
-            output = BytesIO()
-            composite = composite.convert("RGBA")
-            composite.save(output, format="PNG")
-            output.seek(0)
-            print(f"✅ Watermark applied successfully, output size: {len(output.getvalue())} bytes")
-            return output
+    async def start(self):
+        """Start the workers and requeue anything left unprocessed last time"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work(), name=f"webhook-worker-{i}") for i in range(self.workers)]
+        await db.write(_expire_webhook_events, time.time() - WEBHOOK_EVENT_TTL)
+        for event_id, payload in await db.read(_select_pending_webhook_events):
+            event = json.loads(payload)
+            await self._queue.put((event_id, event["type"], event["data"]["object"]))
+
+    async def accept(self, event_id: str, event_type: str, obj, payload: str) -> bool:
+        """Record and queue a verified event; False if it was already received"""
+        if not await db.write(_record_webhook_event, event_id, payload):
+            return False
+        try:
+            self._queue.put_nowait((event_id, event_type, obj))
+        except asyncio.QueueFull:
+            # Let Stripe redeliver it later rather than keep a record we can't act on yet
+            await db.write(_forget_webhook_event, event_id)
+            raise
+        return True
+
+    async def _work(self):
+        await self._ready()
+        while True:
+            event_id, event_type, obj = await self._queue.get()
+            started = time.perf_counter()
+            try:
+                await self.HANDLERS[event_type](event_id, obj)
+                await db.write(_finish_webhook_event, event_id)
+                self._attempts.pop(event_id, None)
+            except Exception:
+                # Stripe already has its 200 and won't redeliver, so retry here
+                attempts = self._attempts[event_id] = self._attempts.get(event_id, 0) + 1
+                if attempts >= WEBHOOK_MAX_ATTEMPTS:
+                    await self._abandon(event_id, event_type, attempts)
+                else:
+                    delay = min(WEBHOOK_RETRY_MAX_DELAY, WEBHOOK_RETRY_DELAY * 2 ** (attempts - 1))
+                    payments_log.exception("Error processing webhook event, will retry",
+                                           extra={"event_id": event_id, "type": event_type, "attempts": attempts, "retry_in": delay})
+                    webhook_retries_total.inc()
+                    self._retry_later((event_id, event_type, obj), delay)
+            finally:
+                self._queue.task_done()
+                services.record("webhook", time.perf_counter() - started)
+
+    async def _abandon(self, event_id: str, event_type: str, attempts: int):
+        """Stop retrying an event that keeps failing; its payload stays in webhook_events"""
+        self._attempts.pop(event_id, None)
+        webhook_events_abandoned_total.inc()
+        payments_log.exception("Giving up on webhook event, confirm this payment by hand",
+                               extra={"event_id": event_id, "type": event_type, "attempts": attempts})
+        try:
+            await db.write(_finish_webhook_event, event_id)
+        except Exception:
+            payments_log.exception("Could not mark abandoned webhook event", extra={"event_id": event_id})
+
+    def _retry_later(self, item, delay: float):
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self._queue.put(item)
+        task = asyncio.create_task(requeue(), name=f"webhook-retry-{item[0]}")
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+webhook_processor = WebhookProcessor(WEBHOOK_WORKERS, WEBHOOK_QUEUE_LIMIT)
+Gauge("webhook_queue_depth", "Webhook events accepted but not yet processed", lambda: webhook_processor._queue.qsize())
 
 # ---------------- Payment Confirmation View ----------------
 class PaymentConfirmView(View):
@@ -259,10 +1446,7 @@ class PaymentConfirmView(View):
         self.amount = amount
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if any(role.name in ALLOWED_ROLE_NAMES for role in interaction.user.roles):
-            return True
-        await interaction.response.send_message("❌ You don't have permission to confirm payments.", ephemeral=True)
-        return False
+        return await staff_interaction_check(interaction, "confirm payments")
 
     @discord.ui.button(label="✅ Payment Received", style=discord.ButtonStyle.success, custom_id="payment_confirm")
     async def confirm_payment(self, interaction: discord.Interaction, button: Button):
@@ -279,76 +1463,391 @@ class PaymentConfirmView(View):
         embed.set_thumbnail(url=WATERMARK_URL)
         
         await interaction.channel.send(embed=embed)
-        print(f"✅ Payment of ${self.amount} confirmed by {interaction.user}")
+        payments_log.info("Payment confirmed manually", extra={"amount": self.amount, "user": str(interaction.user)})
+
+# ---------------- Review Queue ----------------
+# Pending vouches live in the reviews table; only the row ID travels in the
+# button custom_ids, so nothing is held in memory and buttons survive restarts.
+# Approve and Reject claim a review here before their first await, so a
+# second click on either button is turned away instead of racing the first.
+REVIEWS_IN_PROGRESS = set()
+
+def _insert_review(conn: sqlite3.Connection, author_id: int, channel_id: int, image: bytes) -> int:
+    cur = conn.execute(
+        "INSERT INTO reviews(author_id, channel_id, image, created_at) VALUES(?, ?, ?, ?)",
+        (author_id, channel_id, image, time.time())
+    )
+    return cur.lastrowid
 
-# ---------------- Review Buttons ----------------
-class ReviewView(View):
-    def __init__(self, original_author_id: int, original_channel_id: int, image_bytes: bytes, watermark_bytes: bytes):
-        super().__init__(timeout=None)
-        self.original_author_id = original_author_id
-        self.original_channel_id = original_channel_id
-        self.image_bytes = image_bytes
-        self.watermark_bytes = watermark_bytes
+def _select_review(conn: sqlite3.Connection, review_id: int):
+    return conn.execute(
+        "SELECT author_id, channel_id, image FROM reviews WHERE id = ?", (review_id,)
+    ).fetchone()
 
-    async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if any(role.name in ALLOWED_ROLE_NAMES for role in interaction.user.roles):
-            return True
-        await interaction.response.send_message("❌ You don't have permission to approve/reject vouches.", ephemeral=True)
-        return False
+def _delete_review(conn: sqlite3.Connection, review_id: int):
+    conn.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
 
-    @discord.ui.button(label="Approve", style=discord.ButtonStyle.success, custom_id="vouch_approve")
-    async def approve(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.defer()
+async def approve_review(interaction: discord.Interaction, review_id: int):
+    await interaction.response.defer()
+
+    if review_id in REVIEWS_IN_PROGRESS:
+        await interaction.followup.send("⏳ This vouch is already being handled.", ephemeral=True)
+        return
+    REVIEWS_IN_PROGRESS.add(review_id)
+    try:
+        review = await db.read(_select_review, review_id)
+        if review is None:
+            await interaction.followup.send("⚠️ This vouch was already handled.", ephemeral=True)
+            return
+        author_id, channel_id, image_bytes = review
 
-        if self.watermark_bytes:
+        filename = "vouch.png"
+        if bot.watermark_bytes:
+            if image_pool.busy:
+                await interaction.followup.send(f"⏳ Approval queued ({image_pool.stats()}).", ephemeral=True)
             try:
-                image_buf = await watermark_image(self.image_bytes, self.watermark_bytes)
+                image_buf, filename = await watermark_image(image_bytes)
+            except ImagePoolBusy:
+                await interaction.followup.send("⚠️ Too many approvals in progress, please press Approve again in a moment.", ephemeral=True)
+                return
             except Exception as e:
-                print(f"Failed to apply watermark: {e}, using original image")
-                image_buf = BytesIO(self.image_bytes)
+                vouch_log.warning("Watermark failed, using original image", extra={"review_id": review_id, "error": str(e)})
+                image_buf = BytesIO(image_bytes)
         else:
-            print("No watermark available, using original image")
-            image_buf = BytesIO(self.image_bytes)
+            vouch_log.info("No watermark available, using original image", extra={"review_id": review_id})
+            image_buf = BytesIO(image_bytes)
 
         guild = interaction.guild
-        target_channel = guild.get_channel(self.original_channel_id)
+        target_channel = guild.get_channel(channel_id)
         if not target_channel:
             await interaction.followup.send("Original channel not found.", ephemeral=True)
             return
 
-        mention = f"<@{self.original_author_id}>"
-        new_points = add_point(self.original_author_id, 1)
+        mention = f"<@{author_id}>"
+        new_points = await add_point(author_id, 1)
 
-        file = discord.File(fp=image_buf, filename="vouch.png")
+        file = discord.File(fp=image_buf, filename=filename)
         embed = discord.Embed(title="✅ Verified Dish Dynasty vouch", color=discord.Color.green())
-        embed.set_image(url="attachment://vouch.png")
+        embed.set_image(url=f"attachment://{filename}")
         embed.description = f"{mention}\nVerified Dish Dynasty vouch for {mention}! They now have **{new_points}** points."
 
         await target_channel.send(embed=embed, file=file)
+        await db.write(_delete_review, review_id)
+    finally:
+        REVIEWS_IN_PROGRESS.discard(review_id)
 
-        try:
-            await interaction.message.delete()
-        except discord.NotFound:
-            pass
+    try:
+        await interaction.message.delete()
+    except discord.NotFound:
+        pass
 
-    @discord.ui.button(label="Reject", style=discord.ButtonStyle.danger, custom_id="vouch_reject")
-    async def reject(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.defer()
-        try:
-            await interaction.message.delete()
-        except discord.NotFound:
-            pass
-        try:
-            member = interaction.guild.get_member(self.original_author_id)
-            if member:
-                await member.send(f"❌ Your image submitted for vouch was rejected by {interaction.user.display_name}.")
-        except Exception:
-            pass
+async def reject_review(interaction: discord.Interaction, review_id: int):
+    await interaction.response.defer()
+    if review_id in REVIEWS_IN_PROGRESS:
+        await interaction.followup.send("⏳ This vouch is already being handled.", ephemeral=True)
+        return
+    REVIEWS_IN_PROGRESS.add(review_id)
+    try:
+        review = await db.read(_select_review, review_id)
+        await db.write(_delete_review, review_id)
+    finally:
+        REVIEWS_IN_PROGRESS.discard(review_id)
+    try:
+        await interaction.message.delete()
+    except discord.NotFound:
+        pass
+    if review is None:
+        return
+    try:
+        member = interaction.guild.get_member(review[0])
+        if member:
+            await member.send(f"❌ Your image submitted for vouch was rejected by {interaction.user.display_name}.")
+    except Exception:
+        pass
+
+# ---------------- Review Buttons ----------------
+class ReviewButton(discord.ui.DynamicItem[Button], template=r"vouch:(?P<action>approve|reject):(?P<review_id>[0-9]+)"):
+    def __init__(self, action: str, review_id: int):
+        if action == "approve":
+            button = Button(label="Approve", style=discord.ButtonStyle.success, custom_id=f"vouch:approve:{review_id}")
+        else:
+            button = Button(label="Reject", style=discord.ButtonStyle.danger, custom_id=f"vouch:reject:{review_id}")
+        super().__init__(button)
+        self.action = action
+        self.review_id = review_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match):
+        return cls(match["action"], int(match["review_id"]))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await staff_interaction_check(interaction, "approve/reject vouches")
+
+    async def callback(self, interaction: discord.Interaction):
+        if self.action == "approve":
+            await approve_review(interaction, self.review_id)
+        else:
+            await reject_review(interaction, self.review_id)
+
+class ReviewView(View):
+    def __init__(self, review_id: int):
+        super().__init__(timeout=None)
+        self.add_item(ReviewButton("approve", review_id))
+        self.add_item(ReviewButton("reject", review_id))
+
+# ---------------- Leaderboard View ----------------
+class LeaderboardView(View):
+    def __init__(self, author_id: int):
+        super().__init__(timeout=180)
+        self.author_id = author_id
+        self.cursors = [None]  # cursor that opens each page visited so far
+        self.next_cursor = None
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id == self.author_id:
+            return True
+        await interaction.response.send_message("❌ Run `!leaderboard` to browse your own copy.", ephemeral=True)
+        return False
+
+    async def render(self) -> discord.Embed:
+        page_index = len(self.cursors) - 1
+        rows, self.next_cursor = await leaderboard.page(self.cursors[-1], LEADERBOARD_PAGE_SIZE)
+
+        offset = page_index * LEADERBOARD_PAGE_SIZE
+        lines = [
+            f"**#{offset + i}** <@{user_id}> — {pts} point{'s' if pts != 1 else ''}"
+            for i, (user_id, pts) in enumerate(rows, start=1)
+        ]
+        embed = discord.Embed(
+            title="🏆 Dish Dynasty Leaderboard",
+            description="\n".join(lines) or "No points have been awarded yet.",
+            color=0x5865F2
+        )
+        embed.set_thumbnail(url=WATERMARK_URL)
+        embed.set_footer(text=f"Page {page_index + 1}")
+
+        self.previous_page.disabled = page_index == 0
+        self.next_page.disabled = self.next_cursor is None
+        return embed
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: Button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        embed = await self.render()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: Button):
+        if self.next_cursor is not None:
+            self.cursors.append(self.next_cursor)
+        embed = await self.render()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+# ---------------- Message dedupe ----------------
+DISCORD_EPOCH_MS = 1420070400000
+
+class SnowflakeDedupe:
+    """Remembers recently seen message IDs for a fixed window, in arrival order.
+
+    Lookups and inserts hit a dict; the oldest IDs are popped off the front
+    once their snowflake timestamp falls out of the window behind the newest
+    ID seen, or when the ceiling is reached. IDs older than the window are
+    treated as already handled. An ID evicted early by the ceiling could be
+    accepted again, so those evictions are counted and logged; raise
+    DEDUPE_MAX if they show up.
+    """
+
+    def __init__(self, window: float, maxsize: int):
+        self.window_ms = int(window * 1000)
+        self.maxsize = maxsize
+        self._seen = OrderedDict()
+        self._newest_ms = 0
+        self.evicted_early = 0  # dropped by the ceiling while still inside the window
+        self._warned_ms = None  # snowflake time of the last early-eviction warning
+
+    @staticmethod
+    def timestamp_ms(snowflake: int) -> int:
+        return (snowflake >> 22) + DISCORD_EPOCH_MS
+
+    def add(self, snowflake: int) -> bool:
+        """Record an ID; False if it was already seen or is too old to judge"""
+        if snowflake in self._seen:
+            return False
+        created_ms = self.timestamp_ms(snowflake)
+        if created_ms > self._newest_ms:
+            self._newest_ms = created_ms
+        cutoff = self._newest_ms - self.window_ms
+        if created_ms < cutoff:
+            return False
+        self._seen[snowflake] = created_ms
+        seen = self._seen
+        while seen:
+            oldest_ms = next(iter(seen.values()))
+            if oldest_ms >= cutoff and len(seen) <= self.maxsize:
+                break
+            if oldest_ms >= cutoff:
+                self.evicted_early += 1
+                dedupe_evicted_early_total.inc()
+                self._warn_early_eviction()
+            seen.popitem(last=False)
+        return True
+
+    def _warn_early_eviction(self):
+        # At most once per window, so a sustained burst logs a handful of lines
+        if self._warned_ms is None or self._newest_ms - self._warned_ms >= self.window_ms:
+            self._warned_ms = self._newest_ms
+            messages_log.warning("Dedupe ceiling reached, evicting IDs inside the window",
+                                 extra={"max": self.maxsize, "evicted_early": self.evicted_early})
+
+    def __len__(self):
+        return len(self._seen)
+
+processed_messages = SnowflakeDedupe(DEDUPE_WINDOW, DEDUPE_MAX)
+Gauge("processed_messages_remembered", "Message IDs held by the gateway dedupe", lambda: len(processed_messages))
+
+# ---------------- Background services ----------------
+class Service:
+    """One supervised background loop and what it has been doing"""
+
+    def __init__(self, name: str, run):
+        self.name = name
+        self.run = run
+        self.task = None
+        self.state = "stopped"  # running | backoff | stopped
+        self.started_at = None
+        self.restarts = 0
+        self.last_error = None
+        self.iterations = 0
+        self.last_run_ms = None
+        self.last_run_at = None
+
+    def record(self, seconds: float):
+        self.iterations += 1
+        self.last_run_ms = seconds * 1000
+        self.last_run_at = time.time()
+
+class ServiceSupervisor:
+    """Starts registered services exactly once and restarts them when they stop.
+
+    A service is an async callable that runs until cancelled. If it raises
+    or returns, it is restarted after an exponential, jittered backoff. The
+    backoff resets once a run has stayed up for HEALTHY_AFTER seconds.
+    """
+
+    BACKOFF_MIN = 1.0
+    BACKOFF_MAX = 60.0
+    HEALTHY_AFTER = 60.0
+
+    def __init__(self):
+        self.services = {}
+        self._started = False
+
+    def register(self, name: str, run) -> Service:
+        service = self.services[name] = Service(name, run)
+        return service
+
+    def record(self, name: str, seconds: float):
+        """Count one unit of work (a poll, an event) done by a service"""
+        self.services[name].record(seconds)
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for service in self.services.values():
+            service.task = asyncio.create_task(self._supervise(service), name=f"service:{service.name}")
+
+    async def _supervise(self, service: Service):
+        delay = self.BACKOFF_MIN
+        while True:
+            service.state = "running"
+            service.started_at = time.monotonic()
+            try:
+                await service.run()
+                service.last_error = "exited"
+                services_log.warning("Service exited", extra={"service": service.name})
+            except asyncio.CancelledError:
+                service.state = "stopped"
+                raise
+            except Exception as e:
+                service.last_error = f"{type(e).__name__}: {e}"
+                services_log.exception("Service crashed", extra={"service": service.name})
+            if time.monotonic() - service.started_at >= self.HEALTHY_AFTER:
+                delay = self.BACKOFF_MIN
+            service.restarts += 1
+            service.state = "backoff"
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, self.BACKOFF_MAX)
+
+    async def stop(self):
+        running = [service.task for service in self.services.values() if service.task]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        self._started = False
+
+services = ServiceSupervisor()
+
+# ---------------- Watermark ----------------
+# The watermark is kept on disk with its validators, so a restart uses the
+# local copy straight away and only asks the CDN whether it has changed.
+WATERMARK_CACHE_FILE = os.path.join(CACHE_DIR, "watermark.bin")
+WATERMARK_META_FILE = os.path.join(CACHE_DIR, "watermark.json")
+
+def _read_watermark_cache():
+    try:
+        with open(WATERMARK_META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("url") != WATERMARK_URL:
+            return None, {}
+        with open(WATERMARK_CACHE_FILE, "rb") as f:
+            return f.read(), meta
+    except (OSError, ValueError):
+        return None, {}
+
+def _write_watermark_cache(data: bytes, meta: dict):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for path, content, mode in ((WATERMARK_CACHE_FILE, data, "wb"), (WATERMARK_META_FILE, json.dumps(meta), "w")):
+        tmp = path + ".tmp"
+        with open(tmp, mode) as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+async def use_watermark(data: bytes):
+    bot.watermark_bytes = data
+    await image_pool.set_watermark(data)
+
+async def load_watermark():
+    """Serve the cached watermark, then revalidate it against the CDN"""
+    cached, meta = await asyncio.to_thread(_read_watermark_cache)
+    headers = {}
+    if cached:
+        await use_watermark(cached)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        async with http_client.get(WATERMARK_URL, headers=headers) as resp:
+            if resp.status == 304 and cached:
+                startup_log.info("Watermark cache still valid", extra={"bytes": len(cached)})
+                return
+            resp.raise_for_status()
+            data = await resp.read()
+            meta = {"url": WATERMARK_URL, "etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+        await asyncio.to_thread(_write_watermark_cache, data, meta)
+        await use_watermark(data)
+        startup_log.info("Watermark downloaded", extra={"bytes": len(data)})
+    except Exception as e:
+        if cached:
+            startup_log.warning("Watermark revalidation failed, using cached copy", extra={"error": str(e)})
+        else:
+            startup_log.warning("Failed to download watermark, images will be posted without it", extra={"error": str(e)})
 
 # ---------------- Events ----------------
-async def webhook_server():
-    from aiohttp import web
-    
+def build_webhook_app() -> web.Application:
+    """The Stripe webhook and /metrics app, without binding a port"""
     async def handle_webhook(request):
         payload = await request.text()
         sig_header = request.headers.get('stripe-signature')
@@ -356,160 +1855,151 @@ async def webhook_server():
         try:
             event = stripe.Webhook.construct_event(payload, sig_header, WEBHOOK_SECRET)
         except Exception as e:
-            print(f"⚠️ Webhook signature verification failed: {e}")
+            payments_log.warning("Webhook signature verification failed", extra={"error": str(e)})
+            webhook_events_total.inc(outcome="invalid")
             return web.Response(status=400)
         
-        if event['type'] == 'checkout.session.completed':
-            session = event['data']['object']
-            session_id = session['id']
-            
-            if session_id in PAYMENT_SESSIONS:
-                payment_info = PAYMENT_SESSIONS[session_id]
-                channel_id = payment_info['channel_id']
-                amount = payment_info['amount']
-                
-                try:
-                    channel = bot.get_channel(channel_id)
-                    if channel:
-                        embed = discord.Embed(
-                            title="✅ Payment Received",
-                            description=f"Payment of **${amount}** has been successfully received!",
-                            color=discord.Color.green()
-                        )
-                        embed.add_field(name="Amount paid", value=f"${amount}", inline=False)
-                        embed.add_field(name="Status", value="✅ Confirmed", inline=False)
-                        embed.set_footer(text="Thank you for your payment!")
-                        embed.set_thumbnail(url=WATERMARK_URL)
-                        
-                        await channel.send(embed=embed)
-                        print(f"✅ Automatic payment confirmation sent for ${amount} to channel {channel_id}")
-                        del PAYMENT_SESSIONS[session_id]
-                except Exception as e:
-                    print(f"❌ Error sending payment confirmation: {e}")
+        if event['type'] not in WebhookProcessor.HANDLERS:
+            webhook_events_total.inc(outcome="ignored")
+            return web.Response(status=200)
+        if webhook_processor.full:
+            payments_log.warning("Webhook queue full, asking Stripe to retry", extra={"event_id": event['id']})
+            webhook_events_total.inc(outcome="busy")
+            return web.Response(status=503)
+        try:
+            accepted = await webhook_processor.accept(event['id'], event['type'], event['data']['object'], payload)
+        except asyncio.QueueFull:
+            webhook_events_total.inc(outcome="busy")
+            return web.Response(status=503)
+        if not accepted:
+            payments_log.info("Duplicate webhook event skipped", extra={"event_id": event['id']})
+        webhook_events_total.inc(outcome="accepted" if accepted else "duplicate")
         
         return web.Response(status=200)
     
+    async def handle_metrics(request):
+        body = (await render_metrics()).encode()
+        return web.Response(body=body, headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+    
     app = web.Application()
     app.router.add_post('/webhook', handle_webhook)
-    
-    runner = web.AppRunner(app)
+    app.router.add_get('/metrics', handle_metrics)
+    return app
+
+async def webhook_server():
+    """Serve the webhook until cancelled"""
+    # Workers first, so requeued events are never mixed with freshly accepted ones
+    await webhook_processor.start()
+    runner = web.AppRunner(build_webhook_app())
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', 8080)
-    await site.start()
-    print("✅ Stripe webhook server started on port 8080")
+    try:
+        site = web.TCPSite(runner, '0.0.0.0', 8080)
+        await site.start()
+        payments_log.info("Stripe webhook server started", extra={"port": 8080})
+        await asyncio.Future()
+    finally:
+        await runner.cleanup()
+
+bot.watermark_bytes = None
+disconnected_at = None
+ready_once = False
+
+@bot.event
+async def setup_hook():
+    """One-time startup, run once after login and before the gateway connects"""
+    started = time.monotonic()
+    await db.start()
+    await leaderboard.load()
+    await load_tracked_orders()
+    await sweep_payment_sessions()
+    await payment_links.load()
+    if PAYMENT_LINK_WARM_AMOUNTS:
+        asyncio.create_task(payment_links.warm(PAYMENT_LINK_WARM_AMOUNTS))
+    services.start()
+    # Cached copy is applied right away; the CDN check doesn't hold up the connect
+    asyncio.create_task(load_watermark())
+    startup_log.info("Order tracking and webhook systems initialized", extra={"setup_ms": round((time.monotonic() - started) * 1000)})
+
+@bot.event
+async def on_disconnect():
+    global disconnected_at
+    if disconnected_at is None:
+        disconnected_at = time.monotonic()
+
+def _log_reconnected(how: str):
+    global disconnected_at
+    if disconnected_at is not None:
+        startup_log.info("Reconnected", extra={"via": how, "downtime_ms": round((time.monotonic() - disconnected_at) * 1000)})
+        disconnected_at = None
 
 @bot.event
 async def on_ready():
-    print(f"✅ Logged in as {bot.user}")
-    init_db()
-    bot.watermark_bytes = None
-    if not bot.loop.is_running():
-        bot.loop.create_task(update_order_tracking())
-        bot.loop.create_task(webhook_server())
-    async with aiohttp.ClientSession() as s:
-        try:
-            bot.watermark_bytes = await fetch_bytes(s, WATERMARK_URL)
-            print("✅ Watermark downloaded")
-        except Exception as e:
-            print(f"⚠️ Failed to download watermark: {e}")
-            print("⚠️ Images will be posted without watermark")
-            bot.watermark_bytes = None
-    print("✅ Order tracking and webhook systems initialized")
+    # Runs again after every fresh gateway session; nothing here may redo startup work
+    global ready_once
+    if not ready_once:
+        ready_once = True
+        startup_log.info("Logged in", extra={"user": str(bot.user), "time_to_ready_ms": round((time.monotonic() - BOOT_STARTED) * 1000)})
+    else:
+        _log_reconnected("identify")
+
+@bot.event
+async def on_resumed():
+    _log_reconnected("resume")
 
 @bot.event
 async def on_message(message: discord.Message):
-    # Log all messages to debug Tickets v2 submissions
-    print(f"[DEBUG] Message from: {message.author.name} (bot={message.author.bot}) | Channel: {message.channel.name if hasattr(message.channel, 'name') else 'DM'}")
+    started = time.perf_counter()
+    # Everything logged here is DEBUG and gated, so busy channels pay nothing by default
+    debug = messages_log.isEnabledFor(logging.DEBUG)
+    if debug:
+        # Log all messages to debug Tickets v2 submissions
+        messages_log.debug("Message seen", extra={
+            "author": message.author.name,
+            "is_bot": message.author.bot,
+            "channel": getattr(message.channel, "name", "DM")
+        })
     
     # Allow messages from users and Tickets v2 bot (for form submissions with embeds)
     if message.author.bot and message.author.name != "Tickets v2":
         return
 
     # Prevent duplicate command processing
-    if message.id in PROCESSED_MESSAGES:
+    if not processed_messages.add(message.id):
         return
-    PROCESSED_MESSAGES.add(message.id)
-    
-    # Clean up old message IDs to prevent memory leak
-    if len(PROCESSED_MESSAGES) > 10000:
-        PROCESSED_MESSAGES.clear()
-
-    print(f"Message received from {message.author} in channel {message.channel.id}")
-    print(f"Message content: {message.content}")
-    print(f"Message embeds: {len(message.embeds)}")
-    if message.embeds:
+
+    if debug:
+        messages_log.debug("Message received", extra={
+            "author": str(message.author),
+            "channel_id": message.channel.id,
+            "content": message.content,
+            "embeds": len(message.embeds)
+        })
         for i, embed in enumerate(message.embeds):
-            print(f"  Embed {i}: {len(embed.fields) if embed.fields else 0} fields")
-            if embed.fields:
-                for field in embed.fields:
-                    print(f"    Field: {field.name} = {field.value[:100]}")
+            for field in embed.fields:
+                messages_log.debug("Embed field", extra={"embed": i, "field": field.name, "value": field.value[:100]})
 
-    # Check for Uber Eats group order link in ticket channels
+    # Check for Uber Eats group order link in ticket channels (content first,
+    # then Tickets v2 form embeds)
     channel_name = getattr(message.channel, 'name', '')
-    ubereats_link = None
-    
-    # Check content for ubereats link (ubereats.com or eats.uber.com)
-    if "ubereats.com" in message.content or "eats.uber.com" in message.content:
-        print(f"Channel name: {channel_name}, found ubereats in content")
-        for word in message.content.split():
-            if "ubereats.com" in word or "eats.uber.com" in word:
-                ubereats_link = word.strip(">,<()")
-                break
-    
-    # Check embeds for ubereats links (Tickets v2 form submissions)
-    if not ubereats_link:
-        for embed in message.embeds:
-            # Check embed URL
-            if embed.url and ("ubereats.com" in embed.url or "eats.uber.com" in embed.url):
-                ubereats_link = embed.url
-                print(f"Found ubereats link in embed URL: {ubereats_link}")
-                break
-            
-            # Check embed description
-            if embed.description and ("ubereats.com" in embed.description or "eats.uber.com" in embed.description):
-                print(f"Found ubereats in embed description")
-                for word in embed.description.split():
-                    if "ubereats.com" in word or "eats.uber.com" in word:
-                        ubereats_link = word.strip(">,<()[]")
-                        print(f"Found ubereats link in description: {ubereats_link}")
-                        break
-                if ubereats_link:
-                    break
-            
-            # Check embed fields (where Tickets v2 form data is stored)
-            if embed.fields:
-                for field in embed.fields:
-                    # Check field name
-                    if "ubereats.com" in field.name or "eats.uber.com" in field.name:
-                        for word in field.name.split():
-                            if "ubereats.com" in word or "eats.uber.com" in word:
-                                ubereats_link = word.strip(">,<()[]")
-                                print(f"Found ubereats link in field name: {ubereats_link}")
-                                break
-                    
-                    # Check field value (most likely place for user input from form)
-                    if not ubereats_link and ("ubereats.com" in field.value or "eats.uber.com" in field.value):
-                        print(f"Found ubereats in field value: {field.name}")
-                        for word in field.value.split():
-                            if "ubereats.com" in word or "eats.uber.com" in word:
-                                ubereats_link = word.strip(">,<()[]")
-                                print(f"Found ubereats link in field value: {ubereats_link}")
-                                break
-                    
-                    if ubereats_link:
-                        break
-            
-            if ubereats_link:
-                break
+    links = extract_ubereats_links(message.content, message.embeds, limit=1) if channel_name.startswith("ticket-") else []
+    ubereats_link = links[0] if links else None
+    if debug and ubereats_link:
+        messages_log.debug("Found ubereats link", extra={"channel": channel_name, "link": ubereats_link})
     
     if channel_name.startswith("ticket-") and ubereats_link:
-        print(f"Uber Eats group order link detected from {message.author}: {ubereats_link}")
+        scanned = time.perf_counter()
+        # Check the link and eligibility with a single fetch
+        eligibility = await link_inspector.inspect(ubereats_link)
+        tickets_log.info("Uber Eats group order link checked", extra={
+            "author": str(message.author),
+            "link": ubereats_link,
+            "valid": eligibility["success"],
+            "eligible": eligibility["eligible"],
+            "scan_ms": round((scanned - started) * 1000, 2),
+            "inspect_ms": round((time.perf_counter() - scanned) * 1000, 2)
+        })
         
-        # Check the link and eligibility
-        link_valid = await parse_ubereats_group_link(ubereats_link)
-        eligibility = await check_restaurant_eligibility(ubereats_link)
-        
-        if link_valid.get("success"):
+        if eligibility["success"]:
             # Build the embed with just eligibility
             embed = discord.Embed(
                 title="🍔 Uber Eats Group Order",
@@ -536,32 +2026,26 @@ async def on_message(message: discord.Message):
                 break
 
         if image_attachment:
-            async with aiohttp.ClientSession() as session:
-                try:
-                    original_bytes = await fetch_bytes(session, image_attachment.url)
-                except Exception as e:
-                    print("Failed to fetch image:", e)
-                    return
+            try:
+                original_bytes = await fetch_bytes(image_attachment.url)
+            except Exception as e:
+                vouch_log.warning("Failed to fetch vouch image", extra={"url": image_attachment.url, "error": str(e)})
+                return
 
             try:
                 await message.delete()
             except discord.NotFound:
                 pass
             except discord.Forbidden:
-                print("Missing permission to delete message in source channel.")
+                vouch_log.warning("Missing permission to delete message in source channel")
 
             review_channel = bot.get_channel(REVIEW_CHANNEL_ID)
             if not review_channel:
-                print("❌ Review channel not found!")
+                vouch_log.error("Review channel not found", extra={"channel_id": REVIEW_CHANNEL_ID})
                 return
 
-            watermark_bytes = bot.watermark_bytes or b""
-            view = ReviewView(
-                original_author_id=message.author.id,
-                original_channel_id=SOURCE_CHANNEL_ID,
-                image_bytes=original_bytes,
-                watermark_bytes=watermark_bytes
-            )
+            review_id = await db.write(_insert_review, message.author.id, SOURCE_CHANNEL_ID, original_bytes)
+            view = ReviewView(review_id)
 
             preview_file = discord.File(BytesIO(original_bytes), filename="preview.png")
             review_embed = discord.Embed(
@@ -571,7 +2055,11 @@ async def on_message(message: discord.Message):
             )
             review_embed.set_image(url="attachment://preview.png")
             msg = await review_channel.send(embed=review_embed, file=preview_file, view=view)
-            print(f"Review message sent for image from {message.author}")
+            vouch_log.info("Review message sent", extra={
+                "author": str(message.author),
+                "review_id": review_id,
+                "handle_ms": round((time.perf_counter() - started) * 1000, 2)
+            })
             return
 
     # Process commands
@@ -579,9 +2067,8 @@ async def on_message(message: discord.Message):
 
 # ---------------- Commands ----------------
 @bot.command()
+@staff_only()
 async def rules(ctx):
-    if not has_chef_role(ctx.author):
-        return await ctx.reply("❌ You don't have permission to use this command.")
     embed = discord.Embed(
         title="📜 Dish Dynasty Rules",
         description="Please read and follow the rules to keep our community safe and fun!",
@@ -597,37 +2084,46 @@ async def rules(ctx):
     await ctx.send(embed=embed)
 
 @bot.command()
+@staff_only()
 async def total(ctx, amount=None):
-    if not has_chef_role(ctx.author):
-        return await ctx.reply("❌ You don't have permission to use this command.")
     if not ctx.channel.name.startswith("ticket-"):
         return await ctx.reply("⚠️ This command only works in **ticket channels**.")
     if not amount or not amount.replace('.', '', 1).isdigit():
         return await ctx.reply("⚠️ Usage: `!total <amount>`")
     
     try:
-        amount_cents = int(float(amount) * 100)
-        
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[
-                {
-                    "price_data": {
-                        "currency": "usd",
-                        "product_data": {
-                            "name": "Dish Dynasty Order",
-                        },
-                        "unit_amount": amount_cents,
-                    },
-                    "quantity": 1,
-                }
-            ],
-            mode="payment",
-            success_url="https://discord.com",
-            cancel_url="https://discord.com",
-        )
+        amount_cents = round(float(amount) * 100)
         
-        stripe_link = checkout_session.url
+        try:
+            stripe_link = await payment_links.url_for(amount_cents, ctx.channel.id)
+            session_id = None
+        except Exception as e:
+            # Fall back to a one-off Checkout Session for this ticket
+            payments_log.warning("Payment link unavailable, creating a checkout session", extra={"amount": amount, "error": str(e)})
+            with stripe_request_seconds.time(op="checkout_session"):
+                checkout_session = await stripe_client.v1.checkout.sessions.create_async(params={
+                    "payment_method_types": ["card"],
+                    "line_items": [
+                        {
+                            "price_data": {
+                                "currency": "usd",
+                                "product_data": {
+                                    "name": "Dish Dynasty Order",
+                                },
+                                "unit_amount": amount_cents,
+                            },
+                            "quantity": 1,
+                        }
+                    ],
+                    "mode": "payment",
+                    "success_url": "https://discord.com",
+                    "cancel_url": "https://discord.com",
+                    "metadata": {"channel_id": str(ctx.channel.id), "amount": amount},
+                })
+            stripe_link = checkout_session.url
+            session_id = checkout_session.id
+            await db.write(_insert_payment_session, session_id, ctx.channel.id, amount)
+            await sweep_payment_sessions()
         
         embed = discord.Embed(title="💳 Dish Dynasty Payment",
                               description=f"Your total is **${amount}**.\nClick below to pay now ✅",
@@ -635,32 +2131,25 @@ async def total(ctx, amount=None):
         embed.set_thumbnail(url=WATERMARK_URL)
         embed.set_footer(text="Thank you for choosing Dish Dynasty!")
         
-        PAYMENT_SESSIONS[checkout_session.id] = {
-            "channel_id": ctx.channel.id,
-            "amount": amount,
-            "created_at": time.time()
-        }
-        
         view = View()
         button = discord.ui.Button(label="Pay Now", style=discord.ButtonStyle.link, url=stripe_link)
         view.add_item(button)
         
         await ctx.send(embed=embed, view=view)
-        print(f"✅ Payment link created by {ctx.author}: ${amount} (Session: {checkout_session.id})")
+        payments_log.info("Payment link sent", extra={"author": str(ctx.author), "amount": amount, "session_id": session_id})
         
         try:
             await ctx.message.delete()
         except:
             pass
             
-    except Exception as e:
+    except Exception:
         await ctx.send("❌ Failed to create payment link. Please try again.")
-        print(f"Error creating payment link: {e}")
+        payments_log.exception("Error creating payment link", extra={"amount": amount})
 
 @bot.command()
+@staff_only()
 async def howto(ctx):
-    if not has_chef_role(ctx.author):
-        return await ctx.reply("❌ You don't have permission to use this command.")
     embed = discord.Embed(title="🍽️ How To Create a Group Order Link (Uber Eats)",
                           description="Follow these steps to create a group order that qualifies for the **$25 off $25** promo ✅",
                           color=0x5865F2)
@@ -675,57 +2164,247 @@ async def howto(ctx):
 
 @bot.command(name="points")
 async def points_cmd(ctx, member: discord.Member = None):
-    print(f"Points command called by {ctx.author} for member {member}")
+    commands_log.debug("Points command", extra={"author": str(ctx.author), "member": str(member)})
     if not member:
         member = ctx.author
-    pts = get_points(member.id)
+    pts = await get_points(member.id)
     await ctx.send(f"{member.mention} has {pts} point{'s' if pts != 1 else ''}.")
 
+@bot.command(name="vouchqueue")
+@staff_only()
+async def vouchqueue_cmd(ctx):
+    await ctx.send(f"🖼️ Image workers: {image_pool.stats()}")
+
+@bot.command(name="services")
+@staff_only()
+async def services_cmd(ctx):
+    embed = discord.Embed(title="⚙️ Background services", color=discord.Color.blurple())
+    now = time.monotonic()
+    for service in services.services.values():
+        lines = [f"**{service.state}**, {service.restarts} restart{'s' if service.restarts != 1 else ''}"]
+        if service.state == "running":
+            lines[0] += f", up {int(now - service.started_at)}s"
+        if service.last_run_at is not None:
+            lines.append(f"{service.iterations} runs, last took {service.last_run_ms:.0f} ms, {int(time.time() - service.last_run_at)}s ago")
+        else:
+            lines.append("No runs yet")
+        if service.last_error:
+            lines.append(f"Last error: `{service.last_error[:200]}`")
+        embed.add_field(name=service.name, value="\n".join(lines), inline=False)
+    await ctx.send(embed=embed)
+
+@bot.command(name="leaderboard", aliases=["lb"])
+async def leaderboard_cmd(ctx):
+    view = LeaderboardView(ctx.author.id)
+    embed = await view.render()
+    await ctx.send(embed=embed, view=view)
+
+@bot.command(name="rank")
+async def rank_cmd(ctx, member: discord.Member = None):
+    if not member:
+        member = ctx.author
+    pts, rank = await leaderboard.rank(member.id)
+    if not pts:
+        return await ctx.send(f"{member.mention} doesn't have any points yet.")
+    await ctx.send(f"{member.mention} is ranked **#{rank}** with {pts} point{'s' if pts != 1 else ''}.")
+
+# ---------------- Order tracking store ----------------
+class TrackedOrder:
+    """An order being tracked; the message is a PartialMessage (channel + id only)"""
+
+    __slots__ = ("message", "link", "status", "created_at", "delivered_at")
+
+    def __init__(self, message, link: str, status=None, created_at=None, delivered_at=None):
+        self.message = message
+        self.link = link
+        self.status = status
+        self.created_at = created_at if created_at is not None else time.time()
+        self.delivered_at = delivered_at
+
+def _insert_order(conn: sqlite3.Connection, message_id: int, channel_id: int, link: str, created_at: float):
+    conn.execute(
+        "INSERT OR REPLACE INTO orders(message_id, channel_id, link, created_at) VALUES(?, ?, ?, ?)",
+        (message_id, channel_id, link, created_at)
+    )
+
+def _update_order(conn: sqlite3.Connection, message_id: int, status: str, updated_at: float, delivered_at):
+    conn.execute(
+        "UPDATE orders SET status = ?, updated_at = ?, delivered_at = ? WHERE message_id = ?",
+        (status, updated_at, delivered_at, message_id)
+    )
+
+def _delete_orders(conn: sqlite3.Connection, message_ids):
+    conn.executemany("DELETE FROM orders WHERE message_id = ?", [(message_id,) for message_id in message_ids])
+
+def _select_orders(conn: sqlite3.Connection):
+    return conn.execute(
+        "SELECT message_id, channel_id, link, status, created_at, delivered_at FROM orders"
+    ).fetchall()
+
+def _select_expired_orders(conn: sqlite3.Connection, delivered_before: float):
+    # Served by idx_orders_delivered; undelivered rows are not even in the index
+    return conn.execute(
+        "SELECT message_id, channel_id FROM orders WHERE delivered_at IS NOT NULL AND delivered_at <= ?",
+        (delivered_before,)
+    ).fetchall()
+
+async def track_order(message, link: str):
+    """Start tracking an order whose status message is `message`"""
+    order = TrackedOrder(message.channel.get_partial_message(message.id), link)
+    await db.write(_insert_order, message.id, message.channel.id, link, order.created_at)
+    ORDER_TRACKING[message.id] = order
+    order_tracker.schedule(message.id, 0)
+
+async def drop_order(message_id: int):
+    """Stop tracking an order whose message has gone away"""
+    ORDER_TRACKING.pop(message_id, None)
+    edit_coalescer.forget(message_id)
+    await db.write(_delete_orders, [message_id])
+
+async def sweep_delivered_orders():
+    """Delete status messages (and rows) for orders delivered more than DELIVERED_MESSAGE_TTL ago"""
+    expired = await db.read(_select_expired_orders, time.time() - DELIVERED_MESSAGE_TTL)
+    for message_id, channel_id in expired:
+        order = ORDER_TRACKING.pop(message_id, None)
+        message = order.message if order else bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+        edit_coalescer.forget(message_id)
+        try:
+            await message.delete()
+            tracking_log.info("Delivered order message deleted", extra={"message_id": message_id})
+        except discord.HTTPException:
+            pass
+    if expired:
+        await db.write(_delete_orders, [message_id for message_id, _ in expired])
+
+async def load_tracked_orders():
+    """Rehydrate tracked orders after a restart and schedule their next poll"""
+    await sweep_delivered_orders()
+    now = time.time()
+    loaded = 0
+    for message_id, channel_id, link, status, created_at, delivered_at in await db.read(_select_orders):
+        if message_id in ORDER_TRACKING:
+            continue
+        message = bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+        ORDER_TRACKING[message_id] = TrackedOrder(message, link, status, created_at, delivered_at)
+        if delivered_at is not None:
+            order_tracker.schedule(message_id, max(0, delivered_at + DELIVERED_MESSAGE_TTL - now))
+        else:
+            order_tracker.schedule(message_id, random.uniform(0, TRACKING_DEFAULT_INTERVAL))
+        loaded += 1
+    if loaded:
+        tracking_log.info("Tracked orders restored", extra={"orders": loaded})
+
+# Detail fields on a tracking page: (anchor keywords, pattern matched at an anchor in lowercased bytes)
+ORDER_FIELDS = {
+    "driver_name": ((b"driver",), re.compile(rb"""driver["']?\s*[:=]\s*["']?([^"'<>]+)""")),
+    "driver_car": ((b"car", b"vehicle"), re.compile(rb"""(?:car|vehicle|car_type)["']?\s*[:=]\s*["']?([^"'<>]+)""")),
+    "driver_plate": ((b"plate", b"license", b"registration"),
+                     re.compile(rb"""(?:plate|license|license_plate|registration)["']?\s*[:=]\s*["']?([a-z0-9]+)""")),
+    "estimated_time": ((b"deliver", b"estimated", b"arriv"),
+                       re.compile(rb"""(?:delivery[^"'<>\n]{0,64}?time|estimated|arrives|arrival|deliver[^"'<>\n]{0,64}?by)"""
+                                  rb"""["']?\s*[:=]\s*["']?(\d+\s*(?:min|minutes|mins|hr|hours?))""")),
+}
+
+def _first_field_match(lowered: bytes, anchors, pattern):
+    """Leftmost match of `pattern` starting at any of its anchor keywords"""
+    best = None
+    for anchor in anchors:
+        at = lowered.find(anchor)
+        while at != -1 and (best is None or at < best.start()):
+            match = pattern.match(lowered, at)
+            if match:
+                best = match
+                break
+            at = lowered.find(anchor, at + 1)
+    return best
+
+class OrderStatusParser:
+    """Incremental, single-pass reader for an Uber Eats tracking page.
+
+    Raw bytes are fed in chunks as they stream in. Each chunk is lowercased
+    once (ASCII only, so offsets still line up with the original), status
+    keywords are checked with plain substring tests, and detail fields are
+    located with bytes.find on their keywords before a short anchored match,
+    keeping only the first value of each. A tail is carried between chunks
+    so nothing straddling a boundary is missed or truncated. Status keywords
+    keep their old priority: the first one listed that appears anywhere wins.
+    """
+
+    STATUSES = (
+        (b"preparing", "Preparing", 20, "🍳"),
+        (b"confirmed", "Confirmed", 35, "✅"),
+        (b"delivering", "On the Way", 70, "🚗"),
+        (b"delivered", "Delivered", 100, "📦"),
+    )
+    SETTLE = 128  # bytes of lookahead past a match's start before it is trusted
+    CARRY = 256
+    MAX_CARRY = 4096
+
+    def __init__(self, encoding: str = "utf-8"):
+        self.encoding = encoding
+        self.fields = {}
+        self._seen = [False] * len(self.STATUSES)
+        self._carry = b""
+        self._carry_lower = b""
+
+    @property
+    def done(self) -> bool:
+        """True once the rest of the page cannot change the result"""
+        # "preparing" outranks every other status and hides driver details, so only the ETA is left
+        return self._seen[0] and "estimated_time" in self.fields
+
+    def feed(self, chunk: bytes) -> bool:
+        text = self._carry + chunk
+        lowered = self._carry_lower + chunk.lower()
+        for i, (keyword, *_) in enumerate(self.STATUSES):
+            if not self._seen[i] and keyword in lowered:
+                self._seen[i] = True
+        self._scan(text, lowered, final=False)
+        return self.done
+
+    def _scan(self, text: bytes, lowered: bytes, final: bool):
+        resume = max(0, len(text) - self.CARRY)
+        for name, (anchors, pattern) in ORDER_FIELDS.items():
+            if name in self.fields:
+                continue
+            match = _first_field_match(lowered, anchors, pattern)
+            if match is None:
+                continue
+            if not final and (match.end() == len(text) or match.start() > len(text) - self.SETTLE):
+                # Too close to the end to be sure how it matches; look at it again with the next chunk
+                resume = max(min(resume, match.start()), len(text) - self.MAX_CARRY)
+                continue
+            value = text[match.start(1):match.end(1)]
+            self.fields[name] = value.decode(self.encoding, errors="replace").strip()
+        self._carry = text[resume:]
+        self._carry_lower = lowered[resume:]
+
+    def finish(self) -> dict:
+        self._scan(self._carry, self._carry_lower, final=True)
+        self._carry = self._carry_lower = b""
+        rank = next((i for i, seen in enumerate(self._seen) if seen), 0)
+        _, status, progress, emoji = self.STATUSES[rank]
+        result = {"status": status, "progress": progress, "emoji": emoji,
+                  "driver_name": None, "driver_car": None, "driver_plate": None,
+                  "estimated_time": self.fields.get("estimated_time")}
+        if progress >= 70:
+            for name in ("driver_name", "driver_car", "driver_plate"):
+                result[name] = self.fields.get(name)
+        return result
+
 async def fetch_order_status(link):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(link, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                if resp.status == 200:
-                    html = await resp.text()
-                    
-                    # Extract driver info from HTML
-                    driver_name = None
-                    driver_car = None
-                    driver_plate = None
-                    estimated_time = None
-                    
-                    import re
-                    # Look for driver name patterns
-                    name_match = re.search(r'driver["\']?\s*[:=]\s*["\']?([^"\'<>]+)["\']?', html, re.IGNORECASE)
-                    if name_match:
-                        driver_name = name_match.group(1).strip()
-                    
-                    # Look for car/vehicle type
-                    car_match = re.search(r'(car|vehicle|car_type)["\']?\s*[:=]\s*["\']?([^"\'<>]+)["\']?', html, re.IGNORECASE)
-                    if car_match:
-                        driver_car = car_match.group(2).strip()
-                    
-                    # Look for license plate
-                    plate_match = re.search(r'(plate|license|license_plate|registration)["\']?\s*[:=]\s*["\']?([A-Z0-9]+)["\']?', html, re.IGNORECASE)
-                    if plate_match:
-                        driver_plate = plate_match.group(2).strip()
-                    
-                    # Look for estimated delivery time
-                    time_match = re.search(r'(delivery.*?time|estimated|arrives|arrival|deliver.*?by)["\']?\s*[:=]\s*["\']?(\d+\s*(?:min|minutes|mins|hr|hours?))["\']?', html, re.IGNORECASE)
-                    if time_match:
-                        estimated_time = time_match.group(2).strip()
-                    
-                    if "PREPARING" in html or "preparing" in html.lower():
-                        return {"status": "Preparing", "progress": 20, "emoji": "🍳", "driver_name": None, "driver_car": None, "driver_plate": None, "estimated_time": estimated_time}
-                    elif "CONFIRMED" in html or "confirmed" in html.lower():
-                        return {"status": "Confirmed", "progress": 35, "emoji": "✅", "driver_name": None, "driver_car": None, "driver_plate": None, "estimated_time": estimated_time}
-                    elif "DELIVERING" in html or "delivering" in html.lower():
-                        return {"status": "On the Way", "progress": 70, "emoji": "🚗", "driver_name": driver_name, "driver_car": driver_car, "driver_plate": driver_plate, "estimated_time": estimated_time}
-                    elif "DELIVERED" in html or "delivered" in html.lower():
-                        return {"status": "Delivered", "progress": 100, "emoji": "📦", "driver_name": driver_name, "driver_car": driver_car, "driver_plate": driver_plate, "estimated_time": estimated_time}
-                    return {"status": "Preparing", "progress": 20, "emoji": "🍳", "driver_name": None, "driver_car": None, "driver_plate": None, "estimated_time": estimated_time}
+        async with http_client.get(link, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+            if resp.status == 200:
+                parser = OrderStatusParser(resp.charset or "utf-8")
+                read = 0
+                async for chunk in resp.content.iter_chunked(ORDER_PAGE_CHUNK):
+                    read += len(chunk)
+                    if parser.feed(chunk) or read >= ORDER_PAGE_MAX_BYTES:
+                        break
+                return parser.finish()
     except Exception as e:
-        print(f"Error fetching order status: {e}")
+        tracking_log.warning("Error fetching order status", extra={"link": link, "error": str(e)})
     return {"status": "Preparing", "progress": 20, "emoji": "🍳", "driver_name": None, "driver_car": None, "driver_plate": None}
 
 def get_progress_bar(progress):
@@ -733,78 +2412,235 @@ def get_progress_bar(progress):
     empty = 10 - filled
     return "▓" * filled + "░" * empty + f" {progress}%"
 
-async def update_order_tracking():
-    while True:
-        try:
-            await asyncio.sleep(30)
-            for msg_id, order_data in list(ORDER_TRACKING.items()):
+class TokenBucket:
+    """`rate` tokens per `per` seconds, spent one at a time"""
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    async def take(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+class EmbedEditCoalescer:
+    """Sends embed edits for long-lived messages, skipping ones that change nothing.
+
+    Each message keeps a fingerprint of the embed last sent, so identical
+    renders are dropped before they cost an API call. Edits queue per
+    channel and only the newest embed for a message is kept while it waits;
+    one task per channel drains its queue through that channel's token
+    bucket so a busy ticket channel never runs into 429s.
+    """
+
+    def __init__(self, rate: int, per: float, on_missing=None):
+        self.rate = rate
+        self.per = per
+        self.on_missing = on_missing
+        self._sent = {}  # message id -> fingerprint of the embed on Discord
+        self._queues = {}  # channel id -> OrderedDict(message id -> (message, embed, fingerprint))
+        self._buckets = {}
+        self._drains = {}
+        self.skipped = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def fingerprint(embed: discord.Embed) -> int:
+        return hash(json.dumps(embed.to_dict(), sort_keys=True))
+
+    def submit(self, message, embed: discord.Embed) -> bool:
+        """Queue an edit; False if the message already shows this embed"""
+        fingerprint = self.fingerprint(embed)
+        channel_id = message.channel.id
+        pending = self._queues.setdefault(channel_id, OrderedDict())
+        if message.id in pending:
+            self.coalesced += 1
+            tracking_edits_avoided_total.inc(reason="coalesced")
+        elif self._sent.get(message.id) == fingerprint:
+            self.skipped += 1
+            tracking_edits_avoided_total.inc(reason="unchanged")
+            return False
+        pending[message.id] = (message, embed, fingerprint)
+        drain = self._drains.get(channel_id)
+        if drain is None or drain.done():
+            self._drains[channel_id] = asyncio.create_task(self._drain(channel_id))
+        return True
+
+    def forget(self, message_id):
+        self._sent.pop(message_id, None)
+        for pending in self._queues.values():
+            pending.pop(message_id, None)
+
+    async def _drain(self, channel_id):
+        pending = self._queues[channel_id]
+        bucket = self._buckets.setdefault(channel_id, TokenBucket(self.rate, self.per))
+        while pending:
+            await bucket.take()
+            if not pending:
+                break
+            message_id, (message, embed, fingerprint) = pending.popitem(last=False)
+            if self._sent.get(message_id) == fingerprint:
+                self.skipped += 1
+                tracking_edits_avoided_total.inc(reason="unchanged")
+                continue
+            try:
+                await message.edit(embed=embed)
+                self._sent[message_id] = fingerprint
+            except discord.NotFound:
+                self.forget(message_id)
+                if self.on_missing:
+                    await self.on_missing(message_id)
+            except Exception:
+                tracking_log.exception("Error editing tracking message", extra={"message_id": message_id})
+        del self._queues[channel_id]
+
+edit_coalescer = EmbedEditCoalescer(EDIT_RATE, EDIT_PER, on_missing=drop_order)
+
+def tracking_interval(status: str) -> float:
+    """Seconds until the next poll for an order in `status`, with jitter"""
+    interval = TRACKING_INTERVALS.get(status, TRACKING_DEFAULT_INTERVAL)
+    return interval * random.uniform(1 - TRACKING_JITTER, 1 + TRACKING_JITTER)
+
+async def refresh_order(msg_id, order: TrackedOrder):
+    """Poll one order and edit its message; returns seconds until the next poll, or None when done"""
+    current_time = time.time()
+
+    # Delivered orders are not fetched again, only deleted once their time is up
+    if order.delivered_at is not None:
+        time_left = DELIVERED_MESSAGE_TTL - (current_time - order.delivered_at)
+        if time_left > 0:
+            return time_left
+        await sweep_delivered_orders()
+        return None
+
+    status_info = await fetch_order_status(order.link)
+
+    progress = status_info["progress"]
+    status = status_info["status"]
+    emoji = status_info["emoji"]
+    driver_name = status_info.get("driver_name")
+    driver_car = status_info.get("driver_car")
+    driver_plate = status_info.get("driver_plate")
+    estimated_time = status_info.get("estimated_time")
+
+    if progress == 100:
+        order.delivered_at = current_time
+        tracking_log.info("Order delivered", extra={"message_id": msg_id})
+
+    driver_info = "🔍 Not yet assigned"
+    if progress >= 70:
+        if driver_name or driver_car or driver_plate:
+            driver_info = f"👤 {driver_name or 'Driver'}"
+            if driver_car:
+                driver_info += f"\n🚗 {driver_car}"
+            if driver_plate:
+                driver_info += f"\n🏷️ {driver_plate}"
+        else:
+            driver_info = "🚗 Driver arriving soon"
+    if progress >= 100:
+        driver_info = "✅ Order delivered!"
+
+    embed = discord.Embed(
+        title="🍕 Order Tracking",
+        description=f"Real-time Uber Eats order tracking",
+        color=discord.Color.green() if progress == 100 else discord.Color.blurple()
+    )
+    embed.add_field(name=f"{emoji} Status", value=status, inline=False)
+    embed.add_field(name="🚗 Driver", value=driver_info, inline=False)
+    if estimated_time:
+        embed.add_field(name="⏱️ Estimated", value=estimated_time, inline=False)
+    embed.add_field(name="Progress", value=get_progress_bar(progress), inline=False)
+
+    if progress == 100:
+        embed.set_footer(text=f"Message will disappear in {DELIVERED_MESSAGE_TTL} seconds")
+        next_poll = DELIVERED_MESSAGE_TTL
+    else:
+        next_poll = tracking_interval(status)
+        embed.set_footer(text=f"Updates every {TRACKING_INTERVALS.get(status, TRACKING_DEFAULT_INTERVAL)} seconds")
+
+    if status != order.status:
+        order.status = status
+        await db.write(_update_order, msg_id, status, current_time, order.delivered_at)
+    edit_coalescer.submit(order.message, embed)
+    return next_poll
+
+class OrderTracker:
+    """Polls tracked orders when they fall due, a bounded number at a time.
+
+    Next-due times live in a min-heap, so the dispatcher only ever sleeps
+    until the earliest one. Rescheduling pushes a fresh entry and the stale
+    one is skipped when popped. Each order is polled at most once at a time.
+    """
+
+    def __init__(self, concurrency: int):
+        self._heap = []  # (due, seq, msg_id)
+        self._due = {}  # msg_id -> due of its live heap entry
+        self._seq = itertools.count()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wake = asyncio.Event()
+        self._polls = set()
+
+    def schedule(self, msg_id, delay: float):
+        due = time.monotonic() + delay
+        self._due[msg_id] = due
+        heapq.heappush(self._heap, (due, next(self._seq), msg_id))
+        if self._heap[0][2] == msg_id:
+            self._wake.set()
+
+    def __len__(self):
+        return len(self._due)
+
+    async def run(self):
+        """Dispatch due polls until cancelled; run as the order-tracker service"""
+        while True:
+            self._wake.clear()
+            if not self._heap:
+                await self._wake.wait()
+                continue
+            delay = self._heap[0][0] - time.monotonic()
+            if delay > 0:
                 try:
-                    msg = order_data["message"]
-                    link = order_data["link"]
-                    status_info = await fetch_order_status(link)
-                    
-                    progress = status_info["progress"]
-                    status = status_info["status"]
-                    emoji = status_info["emoji"]
-                    driver_name = status_info.get("driver_name")
-                    driver_car = status_info.get("driver_car")
-                    driver_plate = status_info.get("driver_plate")
-                    estimated_time = status_info.get("estimated_time")
-                    
-                    current_time = time.time()
-                    
-                    if progress == 100 and order_data["delivered_time"] is None:
-                        order_data["delivered_time"] = current_time
-                        print(f"✅ Order {msg_id} marked as delivered at {current_time}")
-                    
-                    time_since_delivery = None
-                    if order_data["delivered_time"] is not None:
-                        time_since_delivery = current_time - order_data["delivered_time"]
-                    
-                    if time_since_delivery and time_since_delivery >= 420:
-                        try:
-                            await msg.delete()
-                            print(f"✅ Order {msg_id} message deleted after 7 minutes")
-                        except:
-                            pass
-                        del ORDER_TRACKING[msg_id]
-                        continue
-                    
-                    driver_info = "🔍 Not yet assigned"
-                    if progress >= 70:
-                        if driver_name or driver_car or driver_plate:
-                            driver_info = f"👤 {driver_name or 'Driver'}"
-                            if driver_car:
-                                driver_info += f"\n🚗 {driver_car}"
-                            if driver_plate:
-                                driver_info += f"\n🏷️ {driver_plate}"
-                        else:
-                            driver_info = "🚗 Driver arriving soon"
-                    if progress >= 100:
-                        driver_info = "✅ Order delivered!"
-                    
-                    embed = discord.Embed(
-                        title="🍕 Order Tracking",
-                        description=f"Real-time Uber Eats order tracking",
-                        color=discord.Color.green() if progress == 100 else discord.Color.blurple()
-                    )
-                    embed.add_field(name=f"{emoji} Status", value=status, inline=False)
-                    embed.add_field(name="🚗 Driver", value=driver_info, inline=False)
-                    if estimated_time:
-                        embed.add_field(name="⏱️ Estimated", value=estimated_time, inline=False)
-                    embed.add_field(name="Progress", value=get_progress_bar(progress), inline=False)
-                    
-                    if progress == 100 and time_since_delivery:
-                        time_left = int(420 - time_since_delivery)
-                        embed.set_footer(text=f"Message will disappear in {time_left} seconds")
-                    else:
-                        embed.set_footer(text="Updates every 30 seconds")
-                    
-                    await msg.edit(embed=embed)
-                except Exception as e:
-                    print(f"Error updating order {msg_id}: {e}")
-        except Exception as e:
-            print(f"Error in update_order_tracking: {e}")
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due, _, msg_id = heapq.heappop(self._heap)
+            if self._due.get(msg_id) != due:
+                continue  # rescheduled since
+            del self._due[msg_id]
+            if msg_id not in ORDER_TRACKING:
+                continue
+            await self._slots.acquire()
+            task = asyncio.create_task(self._poll(msg_id))
+            self._polls.add(task)
+            task.add_done_callback(self._polls.discard)
+
+    async def _poll(self, msg_id):
+        next_poll = TRACKING_DEFAULT_INTERVAL
+        started = time.perf_counter()
+        try:
+            order = ORDER_TRACKING.get(msg_id)
+            if order is not None:
+                next_poll = await refresh_order(msg_id, order)
+        except Exception:
+            tracking_log.exception("Error updating order", extra={"message_id": msg_id})
+        finally:
+            self._slots.release()
+            services.record("order-tracker", time.perf_counter() - started)
+        if next_poll is not None and msg_id in ORDER_TRACKING:
+            self.schedule(msg_id, next_poll)
+
+order_tracker = OrderTracker(TRACKING_CONCURRENCY)
+services.register("order-tracker", order_tracker.run)
+services.register("webhook", webhook_server)
 
 @bot.command(name="order")
 async def order_cmd(ctx, uber_link=None):
@@ -824,33 +2660,21 @@ async def order_cmd(ctx, uber_link=None):
     embed.add_field(name="🍳 Status", value="Initializing...", inline=False)
     embed.add_field(name="🔍 Driver", value="Not yet assigned", inline=False)
     embed.add_field(name="Progress", value="▓░░░░░░░░░ 10%", inline=False)
-    embed.set_footer(text="Updates every 30 seconds")
+    embed.set_footer(text="Fetching status...")
     msg = await ctx.send(embed=embed)
     
-    ORDER_TRACKING[msg.id] = {
-        "link": uber_link,
-        "message": msg,
-        "status": "preparing",
-        "progress": 10,
-        "driver_name": None,
-        "driver_car": None,
-        "driver_plate": None,
-        "last_update": 0,
-        "delivered_time": None
-    }
-    print(f"✅ Order tracking started for {ctx.author}: {uber_link}")
+    await track_order(msg, uber_link)
+    tracking_log.info("Order tracking started", extra={"author": str(ctx.author), "link": uber_link, "message_id": msg.id})
 
 # ---------------- NEW STATUS COMMAND (UPDATED WITH AUTO-DELETE) ----------------
 @bot.command()
+@staff_only(HEAD_CHEF_ROLE_NAMES, quiet=True)
 async def status(ctx):
     try:
         await ctx.message.delete()
     except:
         pass
 
-    if not any(role.name == "Head Chef" for role in ctx.author.roles):
-        return await ctx.reply("❌ You don't have permission to use this command.", delete_after=5)
-
     embed = discord.Embed(
         title="📦 Order Availability",
         color=discord.Color.blurple()
@@ -894,16 +2718,14 @@ async def status(ctx):
 # ---------------- OPEN / CLOSED COMMANDS ----------------
 STATUS_CHANNEL_ID = 1439755544448602283
 
-@bot.command()
-async def open(ctx):
+@bot.command(name="open")
+@staff_only(quiet=True)
+async def open_cmd(ctx):
     try:
         await ctx.message.delete()
     except:
         pass
 
-    if not has_chef_role(ctx.author):
-        return await ctx.reply("❌ You don't have permission to use this command.", delete_after=5)
-
     channel = ctx.guild.get_channel(STATUS_CHANNEL_ID)
     if not channel:
         return await ctx.reply("❌ Status channel not found.", delete_after=5)
@@ -912,15 +2734,13 @@ async def open(ctx):
     await ctx.send("🟢 Status set to **OPEN**.", delete_after=5)
 
 @bot.command()
+@staff_only(quiet=True)
 async def closed(ctx):
     try:
         await ctx.message.delete()
     except:
         pass
 
-    if not has_chef_role(ctx.author):
-        return await ctx.reply("❌ You don't have permission to use this command.", delete_after=5)
-
     channel = ctx.guild.get_channel(STATUS_CHANNEL_ID)
     if not channel:
         return await ctx.reply("❌ Status channel not found.", delete_after=5)
@@ -929,4 +2749,34 @@ async def closed(ctx):
     await ctx.send("🔴 Status set to **CLOSED**.", delete_after=5)
 
 # ---------------- Run ----------------
-bot.run(BOT_TOKEN)
\ No newline at end of file
+async def main():
+    listener = setup_logging()
+    startup_log.info("Config loaded", extra={"bot_token_len": len(BOT_TOKEN), "stripe_key_len": len(STRIPE_API_KEY)})
+    if not STRIPE_API_KEY:
+        startup_log.warning("STRIPE_API_KEY not found in environment variables")
+    if not BOT_TOKEN:
+        startup_log.warning("BOT_TOKEN not found in environment variables")
+    # Review buttons are matched by custom_id pattern, so pending vouches keep working after a restart
+    bot.add_dynamic_items(ReviewButton)
+    async with bot:
+        try:
+            await http_client.start()
+            await bot.start(BOT_TOKEN)
+        finally:
+            await services.stop()
+            await image_pool.shutdown()
+            await http_client.close()
+            await stripe_http.close_async()
+            await db.close()
+            listener.stop()
+
+def run():
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    # Image workers are spawned and re-import the launching script; run.py
+    # keeps that to a few lines instead of this whole module
+    sys.exit("Start the bot with: python run.py")
\ No newline at end of file
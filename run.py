@@ -0,0 +1,8 @@
+# Starts the bot: python run.py
+#
+# The bot itself lives in main.py. Image workers are spawned processes that
+# re-import the launching script, so it is imported here only under the
+# __main__ guard; workers then load imaging and nothing else.
+if __name__ == "__main__":
+    import main
+    main.run()